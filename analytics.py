@@ -0,0 +1,204 @@
+import numpy as np
+
+import model
+
+
+class CrowdAnalytics:
+    '''How each player's predictions compare with everyone else's: agreement with the consensus prediction,
+    how often they beat the crowd, a head-to-head record between every pair of players and how well each
+    player predicts each team. Everything is worked out with whole-array operations over the prediction
+    store and kept until the factory's data next changes.'''
+
+    def __init__(self, factory: model.FixtureFactory):
+        self.factory = factory
+        self._version = None
+        self._results = {}
+
+    def _cached(self, name: str, calculate):
+        with self.factory.lock:
+            if self._version != self.factory.version:
+                self._results = {}
+                self._version = self.factory.version
+            if name not in self._results.keys():
+                self._results[name] = calculate()
+            return self._results[name]
+
+    def _arrays(self):
+        store = self.factory.store
+        n = store.fixture_count
+        predicted = (store.predicted_a[:n] >= 0) & (store.predicted_b[:n] >= 0)
+        return store.predicted_a[:n], store.predicted_b[:n], predicted, store.points[:n], store.played()
+
+    def consensus(self):
+        '''The most popular predicted score for each fixture as goal arrays, with the share of the players
+        who predicted it. Fixtures with no predictions have no consensus.'''
+        return self._cached("consensus", self._consensus)
+
+    def _consensus(self):
+
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        n, players = predicted.shape
+
+        # Count each distinct scoreline per fixture in one bincount over (fixture, scoreline) pairs
+        codes = predicted_a.astype(np.int32) * 256 + predicted_b.astype(np.int32)
+        scorelines, inverse = np.unique(codes[predicted], return_inverse=True)
+        rows = np.nonzero(predicted)[0]
+        counts = np.bincount(rows * len(scorelines) + inverse.ravel(),
+                             minlength=n * len(scorelines)).reshape((n, len(scorelines)))
+
+        consensus_a = np.full(n, model.Score.NO_SCORE, dtype=np.int8)
+        consensus_b = np.full(n, model.Score.NO_SCORE, dtype=np.int8)
+        share = np.zeros(n)
+        voters = predicted.sum(axis=1)
+        has_votes = voters > 0
+        if len(scorelines) > 0:
+            best = scorelines[counts.argmax(axis=1)]
+            consensus_a[has_votes] = (best // 256)[has_votes]
+            consensus_b[has_votes] = (best % 256)[has_votes]
+            share[has_votes] = counts.max(axis=1)[has_votes] / voters[has_votes]
+
+        return consensus_a, consensus_b, share
+
+    def agreement(self):
+        '''Boolean matrix indexed by [fixture, player] of who predicted the consensus score'''
+        return self._cached("agreement", self._agreement)
+
+    def _agreement(self):
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        consensus_a, consensus_b, share = self.consensus()
+        return predicted & (predicted_a == consensus_a[:, np.newaxis]) & (predicted_b == consensus_b[:, np.newaxis])
+
+    def beat_the_crowd(self):
+        '''For each player the number of played fixtures they predicted, how many of those they scored more
+        points on than the average of everyone who predicted them, and how many fewer'''
+        return self._cached("beat_the_crowd", self._beat_the_crowd)
+
+    def _beat_the_crowd(self):
+
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        counted = predicted & played[:, np.newaxis]
+
+        voters = counted.sum(axis=1)
+        crowd = np.divide(np.where(counted, points, 0).sum(axis=1), voters,
+                          out=np.zeros(len(voters)), where=voters > 0)
+
+        beaten = counted & (points > crowd[:, np.newaxis])
+        behind = counted & (points < crowd[:, np.newaxis])
+        return counted.sum(axis=0), beaten.sum(axis=0), behind.sum(axis=0)
+
+    def head_to_head(self):
+        '''Matrices indexed by [player, opponent] of the played fixtures that both predicted where the player
+        scored more points than the opponent, and where they scored the same'''
+        return self._cached("head_to_head", self._head_to_head)
+
+    def _head_to_head(self):
+
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        counted = predicted & played[:, np.newaxis]
+
+        # Summing over fixtures for each possible number of points turns the pairwise comparison into a pair
+        # of matrix products rather than a loop over every pair of players
+        players = points.shape[1]
+        wins = np.zeros((players, players))
+        draws = np.zeros((players, players))
+        for level in np.unique(points[counted]):
+            at_level = (counted & (points == level)).astype(np.float32)
+            below_level = (counted & (points < level)).astype(np.float32)
+            wins += at_level.T @ below_level
+            draws += at_level.T @ at_level
+
+        np.fill_diagonal(draws, 0)
+        return wins.astype(np.int32), draws.astype(np.int32)
+
+    def team_accuracy(self):
+        '''The team names and matrices indexed by [team, player] of the played fixtures involving each team
+        that the player predicted, and how many of those they got the result right for'''
+        return self._cached("team_accuracy", self._team_accuracy)
+
+    def _team_accuracy(self):
+
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        store = self.factory.store
+        n = store.fixture_count
+
+        actual_a = store.actual_a[:n, np.newaxis].astype(np.int16)
+        actual_b = store.actual_b[:n, np.newaxis].astype(np.int16)
+        counted = predicted & played[:, np.newaxis]
+        correct = counted & (np.sign(actual_a - actual_b) == np.sign(predicted_a.astype(np.int16) - predicted_b))
+
+        # Which teams play in each fixture
+        team_names = sorted(self.factory.teams.keys())
+        team_index = {team_name: i for i, team_name in enumerate(team_names)}
+        playing = np.zeros((n, len(team_names)), dtype=np.float32)
+        rows = np.arange(n)
+        playing[rows, [team_index[fixture.team_a.name] for fixture in self.factory.fixtures]] = 1
+        playing[rows, [team_index[fixture.team_b.name] for fixture in self.factory.fixtures]] = 1
+
+        return team_names, (playing.T @ counted).astype(np.int32), (playing.T @ correct).astype(np.int32)
+
+    def print(self):
+
+        players = self.factory.store.players
+        agreement = self.agreement()
+        predicted_a, predicted_b, predicted, points, played = self._arrays()
+        counted, beaten, behind = self.beat_the_crowd()
+
+        print("\nPlayers v The Crowd")
+        row_format = "{0:<20} {1:>10} {2:>10} {3:>10} {4:>10}"
+        print(row_format.format("Player", "Agree %", "Played", "Beat", "Behind"))
+        for col in sorted(range(len(players)), key=lambda col: players[col]):
+            made = np.count_nonzero(predicted[:, col])
+            agree = 100 * np.count_nonzero(agreement[:, col]) / made if made > 0 else 0
+            print(row_format.format(players[col], "{0:.1f}".format(agree), counted[col], beaten[col], behind[col]))
+        print("\n")
+
+    MAX_GRID = 20
+
+    def print_head_to_head(self, player_name: str = None):
+        '''Print the head-to-head record of one player against everyone else, or of every pair of players
+        as a grid when there aren't too many of them'''
+
+        players = self.factory.store.players
+        wins, draws = self.head_to_head()
+        order = sorted(range(len(players)), key=lambda col: players[col])
+
+        if player_name is not None:
+            if player_name not in self.factory.store.player_index.keys():
+                raise Exception("No player called {0}.".format(player_name))
+            i = self.factory.store.player_index[player_name]
+            print("\n{0} Head to Head".format(player_name))
+            row_format = "{0:<20} {1:>6} {2:>6} {3:>6}"
+            print(row_format.format("Opponent", "W", "D", "L"))
+            for j in order:
+                if j != i:
+                    print(row_format.format(players[j], wins[i, j], draws[i, j], wins[j, i]))
+            print("\n")
+            return
+
+        if len(players) > CrowdAnalytics.MAX_GRID:
+            raise Exception("Too many players for a grid, pick a player e.g. 'crowd h2h {0}'".format(players[order[0]]))
+
+        print("\nHead to Head (W-D-L)")
+        row_format = "{:<12}" + " {:>12}" * len(order)
+        print(row_format.format("", *[players[col][:12] for col in order]))
+        for i in order:
+            print(row_format.format(players[i][:12], *["-" if i == j else "{0}-{1}-{2}".format(wins[i, j], draws[i, j], wins[j, i])
+                                                       for j in order]))
+        print("\n")
+
+    def print_team(self, team_name: str):
+
+        team_names, counted, correct = self.team_accuracy()
+        if team_name not in team_names:
+            raise Exception("No team called {0}.".format(team_name))
+
+        t = team_names.index(team_name)
+        players = self.factory.store.players
+        accuracy = np.divide(correct[t], counted[t], out=np.zeros(len(players)), where=counted[t] > 0)
+
+        print("\n{0} Predictions".format(team_name))
+        row_format = "{0:<20} {1:>10} {2:>10} {3:>10}"
+        print(row_format.format("Player", "Correct", "Played", "Accuracy"))
+        for col in sorted(range(len(players)), key=lambda col: (-accuracy[col], players[col])):
+            print(row_format.format(players[col], correct[t, col], counted[t, col], "{0:.1%}".format(accuracy[col])))
+        print("\n")
@@ -0,0 +1,269 @@
+import bisect
+import datetime
+import logging
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import instrumentation
+import model
+import snapshot
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class SeasonSummary:
+    '''What is kept of a finished season without its fixtures: the final team table, every player's total
+    and each player's cumulative score at the end of every match day. The arrays are memory-mapped from
+    the summary file so a summary costs next to nothing until it is used.'''
+
+    def __init__(self, meta: dict, arrays: dict, directory: str = ""):
+        self.name = meta["name"]
+        self.filename = os.path.join(directory, meta["filename"])
+        self.source = meta["source"]
+        self.players = meta["players"]
+        self.team_names = meta["teams"]
+        self.fixture_count = meta["fixture_count"]
+        self.played = meta["played"]
+        self.totals = arrays["totals"]
+        self.dates = arrays["dates"]
+        self.cumulative = arrays["cumulative"]
+        self.table = arrays["table"]
+
+    @classmethod
+    def write(cls, filename: str, name: str, factory: model.FixtureFactory, fixtures_filename: str):
+        '''Summarise a loaded season into a summary file, next to the archived copy of its fixtures file,
+        and map it back in'''
+
+        timeline = factory.store.timeline()
+        teams = model.rank_teams(list(factory.teams.values()))
+        meta = {"name": name,
+                "filename": os.path.relpath(fixtures_filename, os.path.dirname(filename)),
+                "source": snapshot.file_key(fixtures_filename),
+                "players": list(factory.store.players),
+                "teams": [team.name for team in teams],
+                "fixture_count": len(factory.fixtures),
+                "played": int(np.count_nonzero(factory.store.played()))}
+        arrays = {"totals": factory.store.totals().astype(np.int32),
+                  "dates": np.array([date.toordinal() for date in timeline.dates], dtype=np.int32),
+                  "cumulative": timeline.cumulative().astype(np.int32),
+                  "table": np.array([[team.won, team.drawn, team.lost, team.goals_for, team.goals_against]
+                                     for team in teams], dtype=np.int32).reshape((-1, 5))}
+
+        snapshot.write_snapshot(filename, meta, arrays)
+        return cls.read(filename)
+
+    @classmethod
+    def read(cls, filename: str):
+        meta, arrays = snapshot.read_snapshot(filename, mmap_mode="r")
+        return cls(meta, arrays, os.path.dirname(filename))
+
+    def is_current(self):
+        '''Is the summary still a match for its archived fixtures file?'''
+        return snapshot.is_current(self.source, self.filename)
+
+    def totals_as_of(self, when: datetime.datetime = None):
+        '''Each player's total at the end of the last match day on or before the specified date'''
+        if when is None:
+            return self.totals
+        i = bisect.bisect_right(self.dates, when.toordinal()) - 1
+        return self.cumulative[i] if i >= 0 else np.zeros(len(self.players), dtype=np.int32)
+
+    def print(self, as_of: datetime.datetime = None, top: int = None):
+
+        print("\n{0}: {1} of {2} fixtures played".format(self.name, self.played, self.fixture_count))
+
+        print("\nTeams")
+        row_format = "{0:<30} {1:>6} {2:>6} {3:>6} {4:>6} {5:>6} {6:>6}"
+        print(row_format.format("Team", "Won", "Drawn", "Lost", "GF", "GA", "Points"))
+        for team_name, (won, drawn, lost, goals_for, goals_against) in list(zip(self.team_names, self.table.tolist()))[:top]:
+            print(row_format.format(team_name, won, drawn, lost, goals_for, goals_against, won * 3 + drawn))
+
+        totals = self.totals_as_of(as_of)
+        print("\nPlayers{0}".format("" if as_of is None else " as of " + as_of.strftime("%d/%m/%Y")))
+        for col in sorted(range(len(self.players)), key=lambda col: (-totals[col], self.players[col])):
+            print("{0:<30} {1:>6}".format(self.players[col], totals[col]))
+        print("\n")
+
+
+class SeasonArchive:
+    '''Every past season kept as a compact summary file in the archive directory, which is all that is
+    needed for the all-time rankings. A season's full fixtures and predictions are only loaded when they
+    are asked for and are then kept in a least recently used cache that holds no more than max_bytes of
+    them, however many seasons there are.'''
+
+    SUFFIX = ".season"
+    DEFAULT_DIRECTORY = os.path.join(DATA_DIR, "archive")
+
+    # Rough size of a loaded fixture's Python objects on top of its rows in the prediction store
+    FIXTURE_BYTES = 600
+
+    def __init__(self, directory: str = None, max_bytes: int = 256 * 1024 * 1024,
+                 scheme: model.ScoringScheme = None):
+        self.directory = directory if directory is not None else SeasonArchive.DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        self.scheme = scheme
+        self.summaries = {}
+        self.loaded = OrderedDict()
+        self.loaded_bytes = 0
+        self.lock = threading.RLock()
+        self.refresh()
+
+    def summary_filename(self, name: str):
+        return os.path.join(self.directory, re.sub(r"\W+", "_", name).strip("_") + SeasonArchive.SUFFIX)
+
+    def fixtures_filename(self, name: str):
+        return os.path.join(self.directory, re.sub(r"\W+", "_", name).strip("_") + ".csv")
+
+    def refresh(self):
+        '''Read the summary of every season in the archive directory'''
+
+        with self.lock:
+            self.summaries = {}
+            if os.path.isdir(self.directory) is False:
+                return
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.endswith(SeasonArchive.SUFFIX) is False:
+                    continue
+                try:
+                    summary = SeasonSummary.read(os.path.join(self.directory, filename))
+                    self.summaries[summary.name] = summary
+                except (IOError, KeyError, snapshot.SnapshotError) as err:
+                    logging.warning("Unable to read season summary %s: %s" % (filename, str(err)))
+
+    def names(self):
+        return list(self.summaries.keys())
+
+    def add(self, name: str, filename: str = None, factory: model.FixtureFactory = None):
+        '''Archive a season from an already loaded factory or by loading its fixtures file. The fixtures file
+        and its submitted predictions are copied into the archive so that the season's detail can still be
+        loaded after the original file is reused for the next season.'''
+
+        if factory is None:
+            factory = model.FixtureFactory(self.scheme)
+            factory.load(filename)
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fixtures_filename = self.fixtures_filename(name)
+            with factory.lock:
+                shutil.copyfile(factory.filename, fixtures_filename)
+                submissions_filename = fixtures_filename + model.FixtureFactory.SUBMISSIONS_SUFFIX
+                if os.path.exists(factory.submissions_filename) is True:
+                    shutil.copyfile(factory.submissions_filename, submissions_filename)
+                elif os.path.exists(submissions_filename) is True:
+                    os.remove(submissions_filename)
+                summary = SeasonSummary.write(self.summary_filename(name), name, factory, fixtures_filename)
+            self.summaries[name] = summary
+            self._forget(name)
+
+        return summary
+
+    def remove(self, name: str):
+        with self.lock:
+            summary = self.summary(name)
+            os.remove(self.summary_filename(name))
+            for filename in (summary.filename, summary.filename + model.FixtureFactory.SUBMISSIONS_SUFFIX,
+                             summary.filename + model.FixtureFactory.SNAPSHOT_SUFFIX):
+                if os.path.exists(filename) is True:
+                    os.remove(filename)
+            del self.summaries[name]
+            self._forget(name)
+
+    def summary(self, name: str):
+        if name not in self.summaries.keys():
+            raise Exception("No season called {0} in the archive.".format(name))
+        return self.summaries[name]
+
+    @staticmethod
+    def factory_bytes(factory: model.FixtureFactory):
+        '''Estimate of the memory a loaded season takes up'''
+        store = factory.store
+        arrays = (store.actual_a, store.actual_b, store.predicted_a, store.predicted_b, store.points, store.when)
+        return sum(array.nbytes for array in arrays) + len(factory.fixtures) * SeasonArchive.FIXTURE_BYTES
+
+    def season(self, name: str):
+        '''A season's fully loaded FixtureFactory, from the cache if it is there'''
+
+        with self.lock:
+            if name in self.loaded.keys():
+                self.loaded.move_to_end(name)
+                instrumentation.stats.count("archive.cache_hits")
+                return self.loaded[name][0]
+
+            summary = self.summary(name)
+            if os.path.exists(summary.filename) is False:
+                raise Exception("The fixtures file for {0} is no longer at {1}.".format(name, summary.filename))
+            if summary.is_current() is False:
+                raise Exception("{0} has changed since {1} was archived, archive it again to load it.".format(
+                    summary.filename, name))
+
+            instrumentation.stats.count("archive.cache_misses")
+            factory = model.FixtureFactory(self.scheme)
+            factory.load(summary.filename)
+
+            size = SeasonArchive.factory_bytes(factory)
+            self.loaded[name] = (factory, size)
+            self.loaded_bytes += size
+            self._evict()
+
+            return factory
+
+    def _evict(self):
+
+        # The season that was just loaded stays even if it is bigger than the cap on its own
+        while self.loaded_bytes > self.max_bytes and len(self.loaded) > 1:
+            name, (factory, size) = self.loaded.popitem(last=False)
+            self.loaded_bytes -= size
+            instrumentation.stats.count("archive.cache_evictions")
+
+    def _forget(self, name: str):
+        if name in self.loaded.keys():
+            factory, size = self.loaded.pop(name)
+            self.loaded_bytes -= size
+
+    def set_max_bytes(self, max_bytes: int):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def player_rankings(self):
+        '''All-time rankings from the season summaries as (player, seasons, seasons won, total points)
+        best first'''
+
+        rankings = {}
+        for summary in self.summaries.values():
+            totals = summary.totals.tolist()
+            best = max(totals, default=None)
+            for player_name, total in zip(summary.players, totals):
+                seasons, won, points = rankings.get(player_name, (0, 0, 0))
+                rankings[player_name] = (seasons + 1, won + (1 if total == best else 0), points + total)
+
+        return sorted(((player_name,) + ranking for player_name, ranking in rankings.items()),
+                      key=lambda ranking: (-ranking[3], ranking[0]))
+
+    def print(self):
+
+        print("\nSeason Archive ({0} seasons, {1:.2f} of {2:.2f} MB of seasons loaded)".format(
+            len(self.summaries), self.loaded_bytes / 1024 / 1024, self.max_bytes / 1024 / 1024))
+        row_format = "{0:<30} {1:>10} {2:>10} {3:>10} {4:>8}"
+        print(row_format.format("Season", "Fixtures", "Played", "Players", "Loaded"))
+        for name, summary in self.summaries.items():
+            print(row_format.format(name + ("" if summary.is_current() is True else " *"), summary.fixture_count,
+                                    summary.played, len(summary.players), "yes" if name in self.loaded.keys() else ""))
+        if not all(summary.is_current() for summary in self.summaries.values()):
+            print("* the archived fixtures file has changed since the season was archived")
+        print("\n")
+
+    def print_rankings(self):
+
+        print("\nAll-Time Rankings")
+        row_format = "{0:<30} {1:>8} {2:>8} {3:>8} {4:>10}"
+        print(row_format.format("Player", "Seasons", "Won", "Points", "Average"))
+        for player_name, seasons, won, points in self.player_rankings():
+            print(row_format.format(player_name, seasons, won, points, "{0:.1f}".format(points / seasons)))
+        print("\n")
@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import csv
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import charts
+import model
+
+# Preset sizes from a single World Cup up to a 50 season archive with 1,000 players
+SIZES = {
+    "worldcup": {"seasons": 1, "groups": 8, "teams_per_group": 4, "double_round": False, "players": 10},
+    "season": {"seasons": 1, "groups": 1, "teams_per_group": 20, "double_round": True, "players": 100},
+    "league": {"seasons": 5, "groups": 1, "teams_per_group": 20, "double_round": True, "players": 300},
+    "archive": {"seasons": 50, "groups": 1, "teams_per_group": 20, "double_round": True, "players": 1000},
+}
+
+
+def round_robin(teams: list, double_round: bool = True):
+    '''Generate the rounds of fixtures for a group of teams using the circle method'''
+
+    teams = list(teams)
+    if len(teams) % 2 == 1:
+        teams.append(None)
+
+    rounds = []
+    for i in range(len(teams) - 1):
+        pairs = [(teams[j], teams[-1 - j]) for j in range(len(teams) // 2)]
+        rounds.append([pair if i % 2 == 0 else (pair[1], pair[0]) for pair in pairs if None not in pair])
+        teams.insert(1, teams.pop())
+
+    if double_round is True:
+        rounds += [[(team_b, team_a) for team_a, team_b in fixtures] for fixtures in rounds]
+
+    return rounds
+
+
+def generate_fixtures(filename: str, seasons: int = 1, groups: int = 1, teams_per_group: int = 20,
+                      double_round: bool = True, players: int = 10, unplayed: float = 0.1,
+                      blank: float = 0.05, seed: int = 0):
+    '''Write a synthetic fixtures file in the Group,TeamA,TeamB,When,Score,<players...> layout'''
+
+    rng = np.random.default_rng(seed)
+    player_names = ["P{0:04d}".format(i + 1) for i in range(players)]
+
+    rows = 0
+    with open(filename, "w", newline="") as fixtures_file:
+        writer = csv.writer(fixtures_file)
+        writer.writerow(["Group", "TeamA", "TeamB", "When", "Score"] + player_names)
+
+        for season in range(seasons):
+            start = datetime.date(2000 + season, 8, 10)
+            season_fixtures = []
+
+            for group in range(groups):
+                group_name = "S{0:02d}{1}".format(season + 1, chr(ord("A") + group)) if groups > 1 \
+                    else "S{0:02d}".format(season + 1)
+                team_names = ["Team {0}{1:02d} ({2})".format(chr(ord("A") + group), i + 1, season + 1)
+                              for i in range(teams_per_group)]
+                for matchday, fixtures in enumerate(round_robin(team_names, double_round)):
+                    for team_a, team_b in fixtures:
+                        season_fixtures.append((start + datetime.timedelta(days=7 * matchday), group_name,
+                                                team_a, team_b))
+
+            season_fixtures.sort(key=lambda fixture: fixture[0])
+            played = int(len(season_fixtures) * (1 - unplayed)) if season == seasons - 1 else len(season_fixtures)
+
+            actual = rng.poisson(1.4, size=(len(season_fixtures), 2))
+            predicted = rng.poisson(1.3, size=(len(season_fixtures), players, 2))
+            blanks = rng.random((len(season_fixtures), players)) < blank
+
+            for i, (when, group_name, team_a, team_b) in enumerate(season_fixtures):
+                score = "{0:02d}:{1:02d}".format(*actual[i]) if i < played else ""
+                predictions = ["" if blanks[i, p] else "{0:02d}:{1:02d}".format(*predicted[i, p])
+                               for p in range(players)]
+                writer.writerow([group_name, team_a, team_b, when.strftime("%d/%m/%Y"), score] + predictions)
+                rows += 1
+
+    return rows
+
+
+def measure(function, repeat: int = 1):
+    '''Time a function and then track its peak memory in a separate run, as tracing slows it down.
+    Anything that the function prints is thrown away.'''
+
+    times = []
+    result = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "peak_bytes": peak}, result
+
+
+def run_size(size_name: str, work_dir: str, repeat: int = 3):
+
+    size = SIZES[size_name]
+    filename = os.path.join(work_dir, "{0}_fixtures.csv".format(size_name))
+    rows = generate_fixtures(filename, **size)
+    cells = rows * size["players"]
+
+    print("{0}: {1:,} fixtures x {2:,} players".format(size_name, rows, size["players"]))
+
+    results = {"fixtures": rows, "players": size["players"], "file_bytes": os.path.getsize(filename)}
+
+    def load():
+        factory = model.FixtureFactory()
+        factory.load(filename, use_snapshot=False)
+        return factory
+
+    results["load"], factory = measure(load, repeat)
+    results["load"]["cells_per_second"] = cells / results["load"]["seconds"]
+
+    results["print_player_scores"], _ = measure(factory.print_player_scores, repeat)
+    results["player_score_history"], _ = measure(factory.player_score_history, repeat)
+    results["print_groups"], _ = measure(factory.print_groups, repeat)
+
+    # Charts are drawn headless into the work directory with an empty cache so that every run renders
+    def draw_chart():
+        charts.cache.images.clear()
+        charts.ScoresChart(factory, headless=True).draw(os.path.join(work_dir, "scores.png"))
+
+    try:
+        results["chart_draw"], _ = measure(draw_chart, 1)
+    except Exception as err:
+        results["chart_draw"] = {"error": str(err)}
+
+    for name in ("load", "print_player_scores", "player_score_history", "print_groups", "chart_draw"):
+        if "seconds" in results[name]:
+            print("\t{0:<22} {1:>9.4f}s {2:>10.1f} MB peak".format(name, results[name]["seconds"],
+                                                                   results[name]["peak_bytes"] / 1e6))
+        else:
+            print("\t{0:<22} failed: {1}".format(name, results[name]["error"]))
+
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    return {"commit": commit,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds")}
+
+
+def compare(results: dict, baseline: dict):
+    '''Print how long each measurement took relative to a previous run'''
+    print("\nCompared with {0}".format(baseline["environment"].get("commit")))
+    for size_name, size_results in results["sizes"].items():
+        if size_name not in baseline["sizes"].keys():
+            continue
+        for name, measurement in size_results.items():
+            before = baseline["sizes"][size_name].get(name)
+            if isinstance(measurement, dict) and "seconds" in measurement and isinstance(before, dict) \
+                    and "seconds" in before:
+                print("\t{0} {1:<22} {2:>6.2f}x".format(size_name, name, measurement["seconds"] / before["seconds"]))
+
+
+def main(argv: list = None):
+
+    parser = argparse.ArgumentParser(description="Benchmark loading, scoring and rendering synthetic leagues")
+    parser.add_argument("--sizes", default="worldcup,season,league",
+                        help="comma separated list of sizes from: " + ", ".join(SIZES.keys()))
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of this many runs")
+    parser.add_argument("--output", default="benchmark_results.json", help="file to write the results to")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = {"environment": environment(), "sizes": {}}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size_name in args.sizes.split(","):
+            results["sizes"][size_name] = run_size(size_name.strip(), work_dir, args.repeat)
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("\nResults written to {0}".format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            compare(results, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
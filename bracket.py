@@ -0,0 +1,362 @@
+import collections
+import heapq
+import itertools
+import re
+
+import numpy as np
+
+import instrumentation
+import model
+
+# The 2018 World Cup knockout stage as (tie, round, team A, team B) where a team is a group position e.g.
+# "1A" for the winner of group A or "2B" for the runner-up of group B, or the winner or loser of an
+# earlier tie e.g. "W R16-1" or "L SF-1". Every tie has to come after the ties that feed it.
+WORLD_CUP_2018 = [
+    ("R16-1", "16", "1A", "2B"),
+    ("R16-2", "16", "1C", "2D"),
+    ("R16-3", "16", "1B", "2A"),
+    ("R16-4", "16", "1D", "2C"),
+    ("R16-5", "16", "1E", "2F"),
+    ("R16-6", "16", "1G", "2H"),
+    ("R16-7", "16", "1F", "2E"),
+    ("R16-8", "16", "1H", "2G"),
+    ("QF-1", "Q", "W R16-1", "W R16-2"),
+    ("QF-2", "Q", "W R16-5", "W R16-6"),
+    ("QF-3", "Q", "W R16-3", "W R16-4"),
+    ("QF-4", "Q", "W R16-7", "W R16-8"),
+    ("SF-1", "S", "W QF-1", "W QF-2"),
+    ("SF-2", "S", "W QF-3", "W QF-4"),
+    ("3rd", "3", "L SF-1", "L SF-2"),
+    ("Final", "F", "W SF-1", "W SF-2"),
+]
+
+
+class GroupStage:
+    '''One group's round robin: its teams, its fixture rows and, once every one of them has been played,
+    the teams in finishing order'''
+
+    __slots__ = ("name", "team_names", "rows", "used", "positions", "dependents", "points")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.team_names = []
+        self.rows = []
+        self.used = set()
+        self.positions = None
+        self.dependents = []
+        self.points = None
+
+
+class Tie:
+    '''One knockout tie between two entrants that are each a group position or the winner or loser of an
+    earlier tie. The teams are None until they are known.'''
+
+    __slots__ = ("name", "round", "sources", "teams", "row", "winner", "loser", "dependents", "points")
+
+    def __init__(self, name: str, round: str, sources: list):
+        self.name = name
+        self.round = round
+        self.sources = sources
+        self.teams = [None, None]
+        self.row = None
+        self.winner = None
+        self.loser = None
+        self.dependents = []
+        self.points = None
+
+
+class Bracket:
+    '''The knockout stage of a tournament worked out from its group tables and results. Players score
+    bracket points for predicting who finishes in each group position that feeds the knockout stage, and
+    who wins each tie. The bracket listens to the factory's events so a new result only resolves and
+    re-scores the group or tie it belongs to, and then only the ties downstream whose teams changed.'''
+
+    ROUND_NAMES = {"16": "Round of 16", "Q": "Quarter Finals", "S": "Semi Finals", "3": "Third Place Play-Off",
+                   "F": "Final"}
+    ROUND_POINTS = {"group": 1, "16": 2, "Q": 4, "S": 8, "3": 4, "F": 16}
+
+    SOURCE_FORMAT = re.compile(r"(?:(\d)(\w+)|([WL]) (.+))")
+
+    def __init__(self, factory: model.FixtureFactory, layout: list = None):
+        self.factory = factory
+        self.layout = layout if layout is not None else WORLD_CUP_2018
+        self.recomputed = []
+        self.build()
+        self.factory.subscribe(self.on_fixture_event)
+
+    def close(self):
+        '''Stop following the factory's events'''
+        self.factory.unsubscribe(self.on_fixture_event)
+
+    def parse_source(self, source: str):
+        match = Bracket.SOURCE_FORMAT.fullmatch(source.strip())
+        if match is None:
+            raise Exception("Bracket entrant {0} not understood.".format(source))
+        if match.group(1) is not None:
+            return "group", match.group(2), int(match.group(1)) - 1
+        return "winner" if match.group(3) == "W" else "loser", match.group(4), None
+
+    def build(self):
+        '''Work out the groups and ties from scratch and then resolve and score every one of them'''
+
+        with self.factory.lock:
+            self.group_stages = {}
+            self.ties = {}
+            for name, round, source_a, source_b in self.layout:
+                tie = Tie(name, round, [self.parse_source(source_a), self.parse_source(source_b)])
+                for kind, key, position in tie.sources:
+                    if kind == "group":
+                        stage = self.group_stages.setdefault(key, GroupStage(key))
+                        stage.used.add(position)
+                        stage.dependents.append(name)
+                    elif key in self.ties.keys():
+                        self.ties[key].dependents.append(name)
+                    else:
+                        raise Exception("Tie {0} has to come before tie {1}.".format(key, name))
+                self.ties[name] = tie
+
+            self.nodes = dict(itertools.chain(self.group_stages.items(), self.ties.items()))
+            self.order = {name: i for i, name in enumerate(self.nodes.keys())}
+            self.fixture_rows = {fixture: row for row, fixture in enumerate(self.factory.fixtures)}
+
+            self._find_group_rows()
+            self.group_of_row = {row: stage for stage in self.group_stages.values() for row in stage.rows}
+            self.tie_of_row = {}
+
+            # Every fixture that isn't part of a group can be a knockout tie once its teams are known
+            self.knockout_rows = {}
+            for row, fixture in enumerate(self.factory.fixtures):
+                if row not in self.group_of_row.keys():
+                    self.knockout_rows.setdefault(frozenset((fixture.team_a.name, fixture.team_b.name)), []).append(row)
+
+            self._update(self.nodes.keys())
+
+    def _find_group_rows(self):
+
+        fixtures = self.factory.fixtures
+        for name, stage in self.group_stages.items():
+            rows = [row for row, fixture in enumerate(fixtures) if fixture.group == name]
+            if len(rows) == 0:
+                raise Exception("No fixtures found for group {0}.".format(name))
+
+            # A knockout round can share its code with a group e.g. F for the final, but only the group's
+            # own teams play more than one fixture under the code
+            appearances = collections.Counter(itertools.chain.from_iterable(
+                (fixtures[row].team_a.name, fixtures[row].team_b.name) for row in rows))
+            members = {team_name for team_name, count in appearances.items() if count > 1}
+            if len(members) == 0:
+                members = set(appearances.keys())
+
+            stage.team_names = sorted(members)
+            stage.rows = [row for row in rows if fixtures[row].team_a.name in members and
+                          fixtures[row].team_b.name in members]
+
+    @instrumentation.timed("bracket.update")
+    def _update(self, names):
+        '''Resolve the named groups and ties again in bracket order, following on to the ties they feed
+        only where the teams going through have changed, and re-score each one that was looked at'''
+
+        self.recomputed = []
+        queued = set(names)
+        pending = [(self.order[name], name) for name in queued]
+        heapq.heapify(pending)
+
+        while len(pending) > 0:
+            order, name = heapq.heappop(pending)
+            node = self.nodes[name]
+            changed = self._resolve_group(node) if isinstance(node, GroupStage) else self._resolve_tie(node)
+            self._score(node)
+            self.recomputed.append(name)
+
+            if changed is True:
+                for dependent in node.dependents:
+                    if dependent not in queued:
+                        queued.add(dependent)
+                        heapq.heappush(pending, (self.order[dependent], dependent))
+
+        instrumentation.stats.count("bracket.recomputed", len(self.recomputed))
+
+    def _resolve_group(self, stage: GroupStage):
+        '''Rank the group on its own fixtures once they have all been played. Returns True if the
+        finishing order changed.'''
+
+        positions = None
+        fixtures = [self.factory.fixtures[row] for row in stage.rows]
+        if all(fixture.is_played() for fixture in fixtures):
+            teams = {team_name: model.Team(team_name) for team_name in stage.team_names}
+            for fixture in fixtures:
+                model.Fixture.apply_result(teams[fixture.team_a.name], teams[fixture.team_b.name], fixture.score)
+            positions = [team.name for team in model.rank_teams(list(teams.values()), fixtures)]
+
+        changed = positions != stage.positions
+        stage.positions = positions
+        return changed
+
+    def _entrant(self, source: tuple):
+        kind, key, position = source
+        if kind == "group":
+            positions = self.group_stages[key].positions
+            return positions[position] if positions is not None and position < len(positions) else None
+        return self.ties[key].winner if kind == "winner" else self.ties[key].loser
+
+    def _resolve_tie(self, tie: Tie):
+        '''Find the teams in a tie, the fixture they play and who went through. Returns True if the winner
+        or loser changed.'''
+
+        if tie.row is not None:
+            del self.tie_of_row[tie.row]
+
+        tie.teams = [self._entrant(source) for source in tie.sources]
+        tie.row = None
+        if None not in tie.teams:
+            for row in self.knockout_rows.get(frozenset(tie.teams), []):
+                if row not in self.tie_of_row.keys():
+                    tie.row = row
+                    self.tie_of_row[row] = tie
+                    break
+
+        # A drawn knockout fixture is left undecided as the score doesn't say who went through
+        winner, loser = None, None
+        if tie.row is not None:
+            fixture = self.factory.fixtures[tie.row]
+            result = fixture.score.result()
+            if result == model.Score.WIN:
+                winner, loser = fixture.team_a.name, fixture.team_b.name
+            elif result == model.Score.LOSE:
+                winner, loser = fixture.team_b.name, fixture.team_a.name
+
+        changed = (winner, loser) != (tie.winner, tie.loser)
+        tie.winner, tie.loser = winner, loser
+        return changed
+
+    def predicted_positions(self, stage: GroupStage):
+        '''Each player's predicted finishing order for a group from their predictions of its fixtures, as
+        team indexes into the group's team names indexed by [position, player]. Players who didn't predict
+        every fixture in the group get -1. Teams are ranked on points, goal difference, goals scored and
+        then name, without the head-to-head tie break.'''
+
+        store = self.factory.store
+        players = len(store.players)
+        if len(stage.rows) == 0:
+            return np.full((len(stage.team_names), players), -1, dtype=np.int32)
+
+        rows = np.array(stage.rows, dtype=np.intp)
+        predicted_a = store.predicted_a[rows].astype(np.int32)
+        predicted_b = store.predicted_b[rows].astype(np.int32)
+        complete = np.all((predicted_a >= 0) & (predicted_b >= 0), axis=0)
+
+        # Which team is at home and away in each fixture, so that the group table is a pair of matrix products
+        team_index = {team_name: i for i, team_name in enumerate(stage.team_names)}
+        home = np.zeros((len(rows), len(stage.team_names)), dtype=np.int32)
+        away = np.zeros((len(rows), len(stage.team_names)), dtype=np.int32)
+        home[np.arange(len(rows)), [team_index[self.factory.fixtures[row].team_a.name] for row in stage.rows]] = 1
+        away[np.arange(len(rows)), [team_index[self.factory.fixtures[row].team_b.name] for row in stage.rows]] = 1
+
+        home_points = np.where(predicted_a > predicted_b, 3, np.where(predicted_a == predicted_b, 1, 0))
+        away_points = np.where(predicted_b > predicted_a, 3, np.where(predicted_a == predicted_b, 1, 0))
+        points = home.T @ home_points + away.T @ away_points
+        goals_for = home.T @ predicted_a + away.T @ predicted_b
+        goals_against = home.T @ predicted_b + away.T @ predicted_a
+        names = np.broadcast_to(np.arange(len(stage.team_names))[:, np.newaxis], points.shape)
+
+        order = np.lexsort((names, -goals_for, goals_against - goals_for, -points), axis=0).astype(np.int32)
+        order[:, ~complete] = -1
+        return order
+
+    def _score(self, node):
+        '''Work out every player's bracket points for one group or tie'''
+
+        store = self.factory.store
+        node.points = np.zeros(len(store.players), dtype=np.int32)
+
+        if isinstance(node, GroupStage):
+            if node.positions is None:
+                return
+            picks = self.predicted_positions(node)
+            for position in node.used:
+                if position < len(node.positions):
+                    correct = picks[position] == node.team_names.index(node.positions[position])
+                    node.points[correct] += Bracket.ROUND_POINTS["group"]
+            return
+
+        if node.winner is None:
+            return
+        predicted_a = store.predicted_a[node.row]
+        predicted_b = store.predicted_b[node.row]
+        predicted = (predicted_a >= 0) & (predicted_b >= 0)
+        if self.factory.fixtures[node.row].team_a.name == node.winner:
+            correct = predicted & (predicted_a > predicted_b)
+        else:
+            correct = predicted & (predicted_b > predicted_a)
+        node.points[correct] += Bracket.ROUND_POINTS.get(node.round, 1)
+
+    def rescore(self):
+        '''Work out everyone's bracket points again without resolving any groups or ties'''
+        for node in self.nodes.values():
+            self._score(node)
+
+    def on_fixture_event(self, event: model.FixtureEvent):
+
+        if event.kind in (model.FixtureEvent.ADDED, model.FixtureEvent.RELOADED):
+            self.build()
+            return
+
+        # New players need a column of points in every group and tie
+        if event.kind == model.FixtureEvent.SUBMITTED or \
+                any(len(node.points) != len(self.factory.store.players) for node in self.nodes.values()):
+            self.rescore()
+
+        row = self.fixture_rows.get(event.fixture) if event.fixture is not None else None
+        node = self.group_of_row.get(row, self.tie_of_row.get(row)) if row is not None else None
+        if node is None:
+            return
+
+        if event.kind == model.FixtureEvent.RESULT:
+            self._update([node.name])
+        elif event.kind == model.FixtureEvent.PREDICTIONS:
+            self._score(node)
+
+    def describe(self, source: tuple):
+        kind, key, position = source
+        if kind == "group":
+            return "{0} Group {1}".format({0: "Winner", 1: "Runner-up"}.get(position, "#{0}".format(position + 1)), key)
+        return "{0} {1}".format("Winner" if kind == "winner" else "Loser", key)
+
+    def scores(self):
+        '''Each player's total bracket points'''
+        totals = sum(node.points for node in self.nodes.values())
+        return {player_name: int(totals[col]) for col, player_name in enumerate(self.factory.store.players)}
+
+    def print(self):
+
+        print("\nKnockout Stage")
+        for round, ties in itertools.groupby(self.ties.values(), key=lambda tie: tie.round):
+            print("\n{0}".format(Bracket.ROUND_NAMES.get(round, round)))
+            for tie in ties:
+                if tie.row is not None:
+                    fixture = self.factory.fixtures[tie.row]
+                    line = "{0} {1} {2} [{3}]".format(fixture.team_a.name, fixture.score, fixture.team_b.name,
+                                                      fixture.when.strftime("%d/%m/%Y"))
+                else:
+                    line = " v ".join(team if team is not None else self.describe(source)
+                                      for team, source in zip(tie.teams, tie.sources))
+                if tie.winner is not None:
+                    line += " - {0} win".format(tie.winner)
+                print("\t{0:<8} {1}".format(tie.name, line))
+        print("\n")
+
+    def print_scores(self):
+
+        players = self.factory.store.players
+        columns = ["group"] + list(dict.fromkeys(tie.round for tie in self.ties.values()))
+        points = {column: np.zeros(len(players), dtype=np.int32) for column in columns}
+        for node in self.nodes.values():
+            points["group" if isinstance(node, GroupStage) else node.round] += node.points
+
+        print("\nBracket Points")
+        row_format = "{:<20}" + " {:>8}" * (len(columns) + 1)
+        print(row_format.format("Player", *["Groups" if column == "group" else column for column in columns], "Total"))
+        totals = sum(points.values())
+        for col in sorted(range(len(players)), key=lambda col: (-totals[col], players[col])):
+            print(row_format.format(players[col], *[points[column][col] for column in columns], totals[col]))
+        print("\n")
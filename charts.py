@@ -1,46 +1,109 @@
-import matplotlib.pyplot as plt
+import hashlib
+import io
+import os
+import weakref
+from collections import OrderedDict
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import instrumentation
 import model
 import numpy as np
 
 
+class ChartCache:
+    '''Rendered PNG images kept for each factory, keyed on a digest of the data that was plotted'''
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.images = weakref.WeakKeyDictionary()
+
+    def get(self, factory: model.FixtureFactory, key: str):
+        images = self.images.get(factory)
+        if images is None or key not in images.keys():
+            return None
+        images.move_to_end(key)
+        return images[key]
+
+    def put(self, factory: model.FixtureFactory, key: str, image: bytes):
+        images = self.images.setdefault(factory, OrderedDict())
+        images[key] = image
+        while len(images) > self.max_size:
+            images.popitem(last=False)
+
+
+cache = ChartCache()
+
+
+def player_colours(count: int):
+    '''A distinct colour for each of any number of players'''
+    if count <= 10:
+        colour_map = matplotlib.colormaps["tab10"]
+        return [colour_map(i) for i in range(count)]
+    elif count <= 20:
+        colour_map = matplotlib.colormaps["tab20"]
+        return [colour_map(i) for i in range(count)]
+    else:
+        colour_map = matplotlib.colormaps["viridis"]
+        return [colour_map(x) for x in np.linspace(0, 1, count)]
+
+
+def data_key(*parts):
+    '''Digest of everything that goes into a chart so an unchanged chart can be found in the cache'''
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            hasher.update(str(part.shape).encode("utf-8"))
+            hasher.update(np.ascontiguousarray(part).tobytes())
+        else:
+            hasher.update(repr(part).encode("utf-8"))
+    return hasher.hexdigest()
+
+
 class ScoresChart:
 
-    def __init__(self, model : model.FixtureFactory):
+    MAX_LEGEND = 20
+
+    def __init__(self, model : model.FixtureFactory, headless: bool = False):
 
         self.model = model
+        self.headless = headless
 
-    def draw(self):
+    def history(self):
+        '''Dates, player names and each player's running total straight from the match day timeline'''
+        timeline = self.model.store.timeline()
+        return timeline.dates, self.model.store.players, timeline.cumulative(), timeline.daily_predictions
 
-        fig = plt.figure(1, figsize=(6,8))
+    def plot_scores(self, fig):
 
-        # Player Score History
-        plt.subplot(2,1, 1)
+        dates, players, cumulative, predictions = self.history()
+        order = sorted(range(len(players)), key=lambda col: players[col])
+        colours = player_colours(len(players))
 
-        plt.ylabel('Score')
-        plt.xlabel('Date')
-        plt.title("Score History")
+        # Player Score History
+        ax = fig.add_subplot(2, 1, 1)
 
-        player_scores = self.model.player_score_history()
-        player_colours = ('c', 'b', 'r', 'violet')
+        ax.set_ylabel('Score')
+        ax.set_xlabel('Date')
+        ax.set_title("Score History")
 
-        count = 0
-        for player in sorted(player_scores.keys()):
-            cum_sum = np.cumsum( list(player_scores[player].values()))
-            plt.plot(list(player_scores[player].keys()),cum_sum, player_colours[count])
-            count +=1
+        for count, col in enumerate(order):
+            # Only plot the dates that the player made predictions for
+            days = np.nonzero(predictions[:, col])[0]
+            ax.plot([dates[i] for i in days], cumulative[days, col], color=colours[count])
 
-        plt.legend(sorted(list(player_scores.keys())),loc='lower right')
-        plt.grid(True)
-        plt.ylim(bottom=0)
+        if len(players) <= ScoresChart.MAX_LEGEND:
+            ax.legend([players[col] for col in order], loc='lower right')
+        ax.grid(True)
+        ax.set_ylim(bottom=0)
 
         # Total Player Scores
-        plt.subplot(2,1, 2)
+        ax = fig.add_subplot(2, 1, 2)
 
-        plt.ylabel('Score')
-        plt.xlabel('Player')
-        plt.title("Scores")
-
-        ax = plt.gca()
+        ax.set_ylabel('Score')
+        ax.set_xlabel('Player')
+        ax.set_title("Scores")
         ax.yaxis.grid(True)
 
         x = list(self.model.scores.keys())
@@ -49,21 +112,143 @@ class ScoresChart:
         min_score = np.min(y)
         max_score = np.max(y)
 
-        plt.ylim(bottom=(max(0,min_score - 10)))
-        plt.ylim(top=(max_score + 10))
-        plt.bar(x_pos,y, align="center")
-        plt.xticks(x_pos,x)
+        ax.set_ylim(bottom=(max(0, min_score - 10)))
+        ax.set_ylim(top=(max_score + 10))
+        ax.bar(x_pos, y, align="center")
+        ax.set_xticks(x_pos)
+        ax.set_xticklabels(x, rotation=90 if len(x) > ScoresChart.MAX_LEGEND else 0)
+
+        add_value_labels(ax, spacing=2)
+
+        fig.tight_layout()
+
+    def plot_player(self, fig, player_name: str):
 
-        ax = plt.gca()
+        dates, players, cumulative, predictions = self.history()
+        col = self.model.store.player_index[player_name]
+        days = np.nonzero(predictions[:, col])[0]
+
+        ax = fig.add_subplot(1, 1, 1)
+        ax.set_ylabel('Score')
+        ax.set_xlabel('Date')
+        ax.set_title("{0} Score History".format(player_name))
+        ax.plot([dates[i] for i in days], cumulative[days, col])
+        ax.grid(True)
+        ax.set_ylim(bottom=0)
+
+        fig.tight_layout()
+
+    def plot_group(self, fig, group: str):
+
+        teams = model.rank_teams([self.model.teams[team_name] for team_name in self.model.groups[group]],
+                                 [fixture for fixture in self.model.fixtures if fixture.group == group])
+
+        ax = fig.add_subplot(1, 1, 1)
+        ax.set_ylabel('Points')
+        ax.set_title("Group {0}".format(group))
+        ax.yaxis.grid(True)
+
+        x_pos = np.arange(len(teams))
+        ax.bar(x_pos, [team.points for team in teams], align="center")
+        ax.set_xticks(x_pos)
+        ax.set_xticklabels([team.name for team in teams], rotation=90)
 
         add_value_labels(ax, spacing=2)
 
         fig.tight_layout()
 
-        plt.savefig('scores.png')
-        plt.show()
+    def render(self, key: str, plot, figsize=(6, 8)):
+        '''Render a chart to PNG bytes with the Agg canvas, or reuse the cached image if its data hasn't changed'''
+
+        image = cache.get(self.model, key)
+        if image is None:
+            instrumentation.stats.count("charts.cache_misses")
+            with instrumentation.stats.timer("charts.render"):
+                fig = Figure(figsize=figsize)
+                FigureCanvasAgg(fig)
+                plot(fig)
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format="png")
+                image = buffer.getvalue()
+            cache.put(self.model, key, image)
+        else:
+            instrumentation.stats.count("charts.cache_hits")
+
+        return image
+
+    def scores_image(self):
+        dates, players, cumulative, predictions = self.history()
+        key = data_key("scores", dates, players, cumulative, predictions, list(self.model.scores.items()))
+        return self.render(key, self.plot_scores)
+
+    def player_image(self, player_name: str):
+        dates, players, cumulative, predictions = self.history()
+        col = self.model.store.player_index[player_name]
+        key = data_key("player", player_name, dates, cumulative[:, col], predictions[:, col])
+        return self.render(key, lambda fig: self.plot_player(fig, player_name), figsize=(6, 4))
+
+    def group_image(self, group: str):
+        teams = [self.model.teams[team_name] for team_name in sorted(self.model.groups[group])]
+        key = data_key("group", group, [(team.name, team.sort_key) for team in teams],
+                       [str(fixture.score) for fixture in self.model.fixtures if fixture.group == group])
+        return self.render(key, lambda fig: self.plot_group(fig, group), figsize=(6, 5))
+
+    @instrumentation.timed("charts.draw")
+    def draw(self, filename: str = 'scores.png', block: bool = True):
+
+        if self.headless is True:
+            if filename is not None:
+                write_if_changed(filename, self.scores_image())
+            return
+
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(1, figsize=(6,8))
+        fig.clear()
+        self.plot_scores(fig)
+
+        if filename is not None:
+            plt.savefig(filename)
+
+        # Without blocking the window is drawn and then left open while the prompt carries on
+        if block is True:
+            plt.show()
+        else:
+            plt.show(block=False)
+            plt.pause(0.001)
+
+    def export(self, directory: str):
+        '''Write the scores chart and a chart for every player and group, returning the files that changed'''
+
+        os.makedirs(directory, exist_ok=True)
+
+        images = {"scores.png": self.scores_image()}
+        for player_name in self.model.store.players:
+            images["player_{0}.png".format(safe_name(player_name))] = self.player_image(player_name)
+        for group in self.model.groups.keys():
+            images["group_{0}.png".format(safe_name(group))] = self.group_image(group)
+
+        written = []
+        for file_name, image in images.items():
+            if write_if_changed(os.path.join(directory, file_name), image) is True:
+                written.append(file_name)
+
+        return written
+
+
+def safe_name(name: str):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(name))
 
 
+def write_if_changed(filename: str, image: bytes):
+    '''Write an image unless the file already holds exactly the same bytes'''
+    if os.path.exists(filename) and os.path.getsize(filename) == len(image):
+        with open(filename, "rb") as image_file:
+            if image_file.read() == image:
+                return False
+    with open(filename, "wb") as image_file:
+        image_file.write(image)
+    return True
 
 
 def add_value_labels(ax, spacing=5):
@@ -1,33 +1,224 @@
 import cmd
+import contextlib
+import datetime
+import sys
+from collections import OrderedDict
 import model
+import analytics
+import archive
+import bracket
 import charts
+import competitions
+import database
+import export
+import instrumentation
+import scenarios
+import server
+import simulator
+import submissions
+import watcher
+import worker
 
 class WCCLI(cmd.Cmd):
 
     intro = "Welcome to the World Cup Predictor.\nType 'start' to get going!\nType 'help' for a list of commands."
     prompt = "What next?"
 
-    def __init__(self):
+    PAGE_SIZE = 40
+
+    # Commands that only read the selected competition, whose output is kept until its data next changes
+    CACHED_COMMANDS = {"scores", "groups", "teams", "history", "asof", "crowd", "bracket", "whatif"}
+    MAX_CACHED_OUTPUTS = 64
+
+    # Commands, and subcommands, that don't need to wait for the fixtures to finish loading
+    BACKGROUND_COMMANDS = {"", "help", "jobs", "stats", "quit", "EOF"}
+    BACKGROUND_SUBCOMMANDS = {"archive": {"", "show", "rankings", "cap"}}
+
+    def __init__(self, background: bool = True):
 
         super(WCCLI, self).__init__()
 
+        self.registry = competitions.CompetitionRegistry.default()
+        self.competition = None
         self.model = None
+        self.watcher = None
+        self.exporter = None
+        self.server = None
+        self.database = None
+        self.analytics = None
+        self.bracket = None
+        self.archive = None
+        self.worker = worker.BackgroundWorker(background)
+        self.outputs = OrderedDict()
+
+    def onecmd(self, line: str):
+
+        command, args, line = self.parseline(line)
+
+        # Anything that reads the fixtures waits for them to finish loading
+        subcommand = args.strip().partition(" ")[0] if args is not None else ""
+        waits = command not in WCCLI.BACKGROUND_COMMANDS and \
+            subcommand not in WCCLI.BACKGROUND_SUBCOMMANDS.get(command, set())
+        if waits is True and len(self.worker.running(blocking_only=True)) > 0:
+            print("Waiting for the fixtures to finish loading...")
+            self.worker.wait(blocking_only=True)
+
+        if command not in WCCLI.CACHED_COMMANDS or self.model is None:
+            return super(WCCLI, self).onecmd(line)
+
+        # Replay the output of a read-only command if the data hasn't changed since it was last run
+        key = (command, args.strip(), self.competition.name, self.model.version)
+        if key in self.outputs.keys():
+            self.outputs.move_to_end(key)
+            instrumentation.stats.count("cli.cached_outputs")
+            print(self.outputs[key], end="")
+            return False
+
+        # Only this thread's output is captured, anything the background worker or watcher prints meanwhile
+        # goes straight to the screen and is never replayed
+        output = worker.ThreadOutput(sys.stdout)
+        with contextlib.redirect_stdout(output):
+            stop = super(WCCLI, self).onecmd(line)
+        print(output.getvalue(), end="")
+
+        # Output is only kept if nothing changed while the command ran
+        if key[3] == self.model.version:
+            self.outputs[key] = output.getvalue()
+            while len(self.outputs) > WCCLI.MAX_CACHED_OUTPUTS:
+                self.outputs.popitem(last=False)
+
+        return stop
+
+    def run_script(self, lines):
+        '''Run each command in a script in turn without prompting, skipping blank lines and # comments,
+        and wait for any background work to finish at the end'''
+        for line in lines:
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            print("{0}{1}".format(self.prompt, line))
+            if self.onecmd(line) is True:
+                break
+        self.worker.wait()
 
     def do_start(self, args):
-        """Load all of the fixtures and predictions"""
+        """Load all of the fixtures and predictions for every competition in the background"""
         try:
-            self.model = model.FixtureFactory()
-            self.model.load()
+            self.stop_watching()
+            self.worker.submit("start", self.load_competitions, blocking=True)
         except Exception as err:
             print(str(err))
 
+    def load_competitions(self):
+
+        registry = competitions.CompetitionRegistry.default()
+        print("\nLoading {0}...".format(", ".join(registry.names())))
+        # Without a background worker, e.g. while profiling, the competitions are loaded on this thread too
+        for competition in registry.load_all(workers=None if self.worker.background is True else 1):
+            print("Unable to load {0}: {1}".format(competition, competition.error))
+        for competition in registry.competitions.values():
+            competition.factory.subscribe(self.on_fixture_event)
+        self.registry = registry
+        self.outputs.clear()
+        self.select_competition(registry.names()[0])
+
+    def do_jobs(self, args):
+        """List the commands running or recently run in the background"""
+        self.worker.print()
+
+    def do_competition(self, args):
+        """Switch to another competition e.g. 'competition World Cup'"""
+        try:
+            if args.strip() != "":
+                name = args.strip()
+            else:
+                name = model.pick("Competition", self.registry.names())
+            self.select_competition(name)
+        except Exception as err:
+            print(str(err))
+
+    def select_competition(self, name: str):
+        competition = self.registry.get(name)
+        if competition.is_loaded() is False:
+            raise Exception("{0} is not loaded.".format(competition))
+        self.stop_watching()
+        self.stop_serving()
+        self.stop_exporting()
+        self.analytics = analytics.CrowdAnalytics(competition.factory)
+        if self.bracket is not None:
+            self.bracket.close()
+            self.bracket = None
+        self.competition = competition
+        self.model = competition.factory
+        self.outputs.clear()
+        print("\n{0} selected.".format(competition))
+
+    def do_totals(self, args):
+        """Print player scores added up across all of the competitions"""
+        try:
+            self.registry.print_player_totals()
+        except Exception as err:
+            print(str(err))
+
+    def do_result(self, args):
+        """Enter a new or corrected result e.g. 'result Arsenal,Chelsea,02:01'"""
+        try:
+            team_a_name, team_b_name, score = [arg.strip() for arg in args.split(",")]
+            self.model.update_result(team_a_name, team_b_name, score)
+        except Exception as err:
+            print(str(err))
+
+    def do_submit(self, args):
+        """Submit a prediction e.g. 'submit KAW,Arsenal,Chelsea,02:01' or a batch of them from a file with
+        Player, TeamA, TeamB, Score and optional Submitted columns e.g. 'submit predictions.csv'"""
+        try:
+            if args.count(",") == 3:
+                player, team_a_name, team_b_name, score = [arg.strip() for arg in args.split(",")]
+                batch = [submissions.Submission(player, team_a_name, team_b_name, score)]
+            else:
+                batch = submissions.PredictionIngester.read_csv(args.strip())
+            submissions.PredictionIngester(self.model).submit(batch).print()
+        except Exception as err:
+            print(str(err))
+
+    def do_watch(self, args):
+        """Watch the fixtures file and apply changes as they are saved. Type 'watch off' to stop."""
+        try:
+            if args.strip() == "off":
+                self.stop_watching()
+                print("Stopped watching.")
+            else:
+                self.stop_watching()
+                self.watcher = watcher.FixtureWatcher()
+                self.watcher.watch(self.model)
+                self.watcher.start()
+                print("Watching {0} for changes...".format(self.model.filename))
+        except Exception as err:
+            print(str(err))
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def on_fixture_event(self, event: model.FixtureEvent):
+        print("\nUpdated {0}".format(event))
+
     def do_print(self, args):
-        """Print all of the loaded details"""
+        """Print all of the loaded details, optionally filtered e.g. 'print team=Arsenal, played=no, page=20'
+        Filters: player, group, team, from=dd/mm/yyyy, to=dd/mm/yyyy, played=yes/no, page=lines per page"""
         try:
-            self.model.print()
+            fixture_filter = model.FixtureFilter.parse(args)
+            self.model.print(fixture_filter, self.page_size(fixture_filter))
         except Exception as err:
             print(str(err))
 
+    def page_size(self, fixture_filter: model.FixtureFilter):
+        # Only page output by default when someone is there to press Enter
+        if fixture_filter.page_size is not None:
+            return fixture_filter.page_size
+        return WCCLI.PAGE_SIZE if sys.stdin.isatty() else None
+
     def do_scores(self, args):
         """Print player scores"""
         try:
@@ -36,25 +227,232 @@ class WCCLI(cmd.Cmd):
             print(str(err))
 
     def do_predos(self, args):
-        """Print specific player's predictions and scores"""
+        """Print specific player's predictions and scores, optionally filtered e.g. 'predos player=KAW, group=A'"""
         try:
-            player_name = model.pick("Player", sorted(list(self.model.predictions.keys())))
-            predos = list(self.model.predictions[player_name])
-            predos.sort(reverse=False)
-            for predo in predos:
-                print(predo)
+            fixture_filter = model.FixtureFilter.parse(args)
+            if fixture_filter.player is None:
+                fixture_filter.player = model.pick("Player", sorted(list(self.model.predictions.keys())))
+            predos = self.model.iter_predictions(fixture_filter.player, fixture_filter, sort=True)
+            model.print_paged((str(predo) for predo in predos), self.page_size(fixture_filter))
 
         except Exception as err:
             print(str(err))
 
+    def do_crowd(self, args):
+        """Compare the players with the crowd. Type 'crowd h2h [player]' for head-to-head records
+        or 'crowd team <team>' for who predicts a team best e.g. 'crowd team Arsenal'"""
+        try:
+            command, _, rest = args.strip().partition(" ")
+            if command == "h2h":
+                self.analytics.print_head_to_head(rest.strip() if rest.strip() != "" else None)
+            elif command == "team":
+                self.analytics.print_team(rest.strip())
+            else:
+                self.analytics.print()
+        except Exception as err:
+            print(str(err))
+
+    def do_bracket(self, args):
+        """Show the knockout stage worked out from the group tables and results.
+        Type 'bracket scores' for the players' points for predicting who goes through."""
+        try:
+            if self.bracket is None:
+                self.bracket = bracket.Bracket(self.model)
+            if args.strip() == "scores":
+                self.bracket.print_scores()
+            else:
+                self.bracket.print()
+        except Exception as err:
+            print(str(err))
+
+    def do_archive(self, args):
+        """List the archived seasons. Type 'archive add' to archive every loaded competition or
+        'archive add <season>=<file>' to archive a fixtures file, 'archive rankings' for the all-time
+        rankings, 'archive show <season> [dd/mm/yyyy]' for a season's summary, 'archive detail <season>'
+        for all of a season's fixtures, 'archive remove <season>' or 'archive cap <MB>' to set how much
+        memory fully loaded seasons can use."""
+        try:
+            if self.archive is None:
+                self.archive = archive.SeasonArchive()
+
+            command, _, rest = args.strip().partition(" ")
+            rest = rest.strip()
+            if command == "add" and rest == "":
+                for competition in self.registry.competitions.values():
+                    if competition.is_loaded() is True:
+                        self.archive.add(competition.name, factory=competition.factory)
+                        print("Archived {0}.".format(competition.name))
+            elif command == "add":
+                name, _, filename = rest.partition("=")
+                self.archive.add(name.strip(), filename.strip())
+                print("Archived {0}.".format(name.strip()))
+            elif command == "rankings":
+                self.archive.print_rankings()
+            elif command == "show":
+                name, _, when = rest.rpartition(" ")
+                try:
+                    as_of = datetime.datetime.strptime(when, "%d/%m/%Y")
+                except ValueError:
+                    name, as_of = rest, None
+                self.archive.summary(name).print(as_of)
+            elif command == "detail":
+                self.archive.season(rest).print(page_size=WCCLI.PAGE_SIZE if sys.stdin.isatty() else None)
+            elif command == "remove":
+                self.archive.remove(rest)
+            elif command == "cap":
+                self.archive.set_max_bytes(int(float(rest) * 1024 * 1024))
+                self.archive.print()
+            else:
+                self.archive.print()
+        except Exception as err:
+            print(str(err))
+
+    def do_whatif(self, args):
+        """Show who can still finish first and the results they need from the pending fixtures.
+        Type 'whatif <workers>' to set how many processes to use e.g. 'whatif 4'"""
+        try:
+            workers = int(args.strip()) if args.strip() != "" else None
+            scenarios.ScenarioEvaluator(self.model).run(workers).print()
+        except Exception as err:
+            print(str(err))
+
     def do_history(self, args):
         """Print history of scores by date"""
         self.model.print_player_score_history()
 
 
     def do_chart(self, args):
-        chart = charts.ScoresChart(self.model)
-        chart.draw()
+        """Show the scores chart. Type 'chart save [dir]' to save the scores, player and group charts instead."""
+        try:
+            if args.strip().startswith("save"):
+                directory = args.strip()[4:].strip() or "charts"
+                chart = charts.ScoresChart(self.model, headless=True)
+
+                def save():
+                    # Results and submissions change the store on the main thread while this renders
+                    with chart.model.lock:
+                        written = chart.export(directory)
+                    print("Saved {0} changed charts to {1}.".format(len(written), directory))
+
+                self.worker.submit("chart save", save)
+            else:
+                chart = charts.ScoresChart(self.model)
+                chart.draw(block=False)
+        except Exception as err:
+            print(str(err))
+
+    def do_asof(self, args):
+        """Print the groups, teams and player scores as they were on a date e.g. 'asof 26/12/2018'"""
+        try:
+            as_of = datetime.datetime.strptime(args.strip(), "%d/%m/%Y")
+            self.model.print_groups(as_of)
+            self.model.print_teams(as_of)
+            self.model.print_player_scores(as_of)
+        except Exception as err:
+            print(str(err))
+
+    def do_simulate(self, args):
+        """Simulate the remaining fixtures e.g. 'simulate 100000' for 100,000 simulations"""
+        try:
+            simulations = int(args) if args.strip() != "" else 10000
+            result = simulator.SeasonSimulator(self.model).run(simulations)
+
+            # A single league has relegation places whereas groups just have qualifiers at the top
+            result.print(relegation_places=3 if len(self.model.groups) == 1 else 0)
+        except Exception as err:
+            print(str(err))
+
+    def do_export(self, args):
+        """Export the standings, scores and history for the results site e.g. 'export site'.
+        Type 'export auto' to export again after every change."""
+        try:
+            auto = args.strip().startswith("auto")
+            directory = args.strip()[4:].strip() if auto is True else args.strip()
+            if self.exporter is None or (directory != "" and directory != self.exporter.directory):
+                self.stop_exporting()
+                self.exporter = export.Exporter(self.model, directory if directory != "" else "site")
+            written = self.exporter.export(force=False)
+            print("Exported {0} changed files to {1}.".format(len(written), self.exporter.directory))
+            if auto is True:
+                self.exporter.attach()
+                print("Exporting after every change.")
+        except Exception as err:
+            print(str(err))
+
+    def do_serve(self, args):
+        """Serve the leaderboards as JSON over HTTP in the background e.g. 'serve 8080'. Type 'serve off' to stop."""
+        try:
+            self.stop_serving()
+            if args.strip() != "off":
+                self.server = server.LeaderboardServer(self.model, port=int(args) if args.strip() != "" else 8080)
+                self.server.start()
+                print("Serving {0} on http://{1}:{2}/".format(self.competition, self.server.host, self.server.port))
+        except Exception as err:
+            print(str(err))
+
+    def stop_exporting(self):
+        if self.exporter is not None:
+            self.exporter.detach()
+            self.exporter = None
+
+    def stop_serving(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def do_db(self, args):
+        """Query the SQLite fixtures database e.g. 'db scores World Cup'.
+        Type 'db import' to import the selected competition, 'db seasons' to list the seasons in the database
+        or 'db groups|teams|scores|history [season]' for a season (the selected competition by default)."""
+        try:
+            command, _, season = args.strip().partition(" ")
+            season = season.strip() if season.strip() != "" else str(self.competition)
+            if self.database is None:
+                self.database = database.FixtureDatabase(scheme=self.model.scheme if self.model is not None else None)
+
+            if command == "import":
+                count = self.database.import_csv(self.model.filename, season)
+                print("Imported {0} fixtures as {1}.".format(count, season))
+            elif command == "seasons":
+                print("\n".join(self.database.seasons()))
+            elif command == "groups":
+                self.database.print_groups(season)
+            elif command == "teams":
+                self.database.print_teams(season)
+            elif command == "scores":
+                self.database.print_player_scores(season)
+            elif command == "history":
+                self.database.print_player_score_history(season)
+            else:
+                raise Exception("Unknown db command '{0}'.".format(command))
+        except Exception as err:
+            print(str(err))
+
+    def do_stats(self, args):
+        """Print the load, aggregation and chart timings. Type 'stats on', 'stats off' or 'stats reset'
+        to control them, or 'stats profile <command>' to run a command under cProfile and tracemalloc."""
+        try:
+            command, _, rest = args.strip().partition(" ")
+            if command == "on":
+                instrumentation.stats.enabled = True
+                print("Instrumentation on.")
+            elif command == "off":
+                instrumentation.stats.enabled = False
+                print("Instrumentation off.")
+            elif command == "reset":
+                instrumentation.stats.reset()
+            elif command == "profile":
+                # The profiler only sees this thread, so the command's jobs are run on it rather than in the background
+                self.worker.wait()
+                background, self.worker.background = self.worker.background, False
+                try:
+                    instrumentation.profile(lambda: self.onecmd(rest))
+                finally:
+                    self.worker.background = background
+            else:
+                instrumentation.stats.print()
+        except Exception as err:
+            print(str(err))
 
     def do_groups(self, args):
         """Print Group details"""
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import model
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+class Competition:
+    '''A named fixtures file and the FixtureFactory that it is loaded into'''
+
+    def __init__(self, name: str, filename: str, scheme: model.ScoringScheme = None):
+        self.name = name
+        self.filename = filename
+        self.factory = model.FixtureFactory(scheme)
+        self.factory.filename = filename
+        self.error = None
+
+    def __str__(self):
+        return self.name
+
+    def is_loaded(self):
+        return self.factory.version > 0
+
+    def load(self):
+        self.factory.load(self.filename)
+        return self
+
+
+class CompetitionRegistry:
+    '''All of the competitions being played, each with its own fixtures and prediction league'''
+
+    def __init__(self):
+        self.competitions = {}
+
+    @classmethod
+    def default(cls):
+        registry = cls()
+        registry.add("Premier League", os.path.join(DATA_DIR, "PL_fixtures.csv"))
+        registry.add("World Cup", os.path.join(DATA_DIR, "fixtures.csv"))
+        return registry
+
+    def add(self, name: str, filename: str, scheme: model.ScoringScheme = None):
+        competition = Competition(name, filename, scheme)
+        self.competitions[name] = competition
+        return competition
+
+    def get(self, name: str):
+        if name not in self.competitions.keys():
+            raise Exception("No competition called {0}.".format(name))
+        return self.competitions[name]
+
+    def names(self):
+        return list(self.competitions.keys())
+
+    def load_all(self, workers: int = None, reload: bool = False):
+        '''Load every competition in parallel, or one after another on this thread with one worker, skipping
+        any that are already loaded unless reload is True. Returns the competitions that failed to load.'''
+
+        competitions = [competition for competition in self.competitions.values()
+                        if reload is True or competition.is_loaded() is False]
+
+        def load(competition: Competition):
+            try:
+                competition.load()
+                competition.error = None
+            except Exception as err:
+                competition.error = err
+            return competition
+
+        if workers == 1:
+            for competition in competitions:
+                load(competition)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(load, competitions))
+
+        return [competition for competition in competitions if competition.error is not None]
+
+    def player_totals(self):
+        '''Each player's total points summed across every loaded competition'''
+
+        totals = {}
+        for competition in self.competitions.values():
+            if competition.is_loaded() is False:
+                continue
+            for player_name, score in competition.factory.scores.items():
+                totals[player_name] = totals.get(player_name, 0) + score
+
+        return totals
+
+    def print_player_totals(self):
+
+        hst = model.HighScoreTable("All Competitions", max_size=None)
+        for player_name, score in self.player_totals().items():
+            hst.add(player_name, score)
+
+        hst.print()
+        print("\n")
@@ -0,0 +1,300 @@
+import csv
+import datetime
+import os
+import sqlite3
+
+import model
+
+
+class FixtureDatabase:
+    '''Fixtures, teams, players and predictions kept in normalized SQLite tables so that any number of
+    seasons can be archived without loading them into memory. The standings, player scores and score
+    history are all worked out by SQL queries over just the season being looked at.'''
+
+    DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "data", "fixtures.db")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE);
+        CREATE TABLE IF NOT EXISTS fixtures (
+            id INTEGER PRIMARY KEY,
+            season TEXT NOT NULL,
+            grp TEXT NOT NULL,
+            team_a_id INTEGER NOT NULL REFERENCES teams(id),
+            team_b_id INTEGER NOT NULL REFERENCES teams(id),
+            played_on TEXT NOT NULL,
+            goals_a INTEGER,
+            goals_b INTEGER);
+        CREATE TABLE IF NOT EXISTS entries (
+            season TEXT NOT NULL,
+            player_id INTEGER NOT NULL REFERENCES players(id),
+            PRIMARY KEY (season, player_id));
+        CREATE TABLE IF NOT EXISTS predictions (
+            fixture_id INTEGER NOT NULL REFERENCES fixtures(id) ON DELETE CASCADE,
+            player_id INTEGER NOT NULL REFERENCES players(id),
+            goals_a INTEGER NOT NULL,
+            goals_b INTEGER NOT NULL,
+            PRIMARY KEY (fixture_id, player_id));
+        CREATE INDEX IF NOT EXISTS fixtures_date ON fixtures (season, played_on);
+        CREATE INDEX IF NOT EXISTS fixtures_group ON fixtures (season, grp);
+        CREATE INDEX IF NOT EXISTS fixtures_team_a ON fixtures (team_a_id);
+        CREATE INDEX IF NOT EXISTS fixtures_team_b ON fixtures (team_b_id);
+        CREATE INDEX IF NOT EXISTS predictions_player ON predictions (player_id, fixture_id);
+    """
+
+    # Latest possible ISO date so that a query without an as of date includes everything
+    END_OF_TIME = "9999-12-31"
+
+    def __init__(self, filename: str = None, scheme: model.ScoringScheme = None):
+        self.filename = filename if filename is not None else FixtureDatabase.DEFAULT_FILE
+        self.scheme = scheme if scheme is not None else model.ScoringScheme()
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(FixtureDatabase.SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def import_csv(self, filename: str, season: str = None):
+        '''Bulk insert a fixtures file in the usual CSV layout as a season, replacing any earlier import of
+        the same season. Returns the number of fixtures imported.'''
+
+        if season is None:
+            season = os.path.splitext(os.path.basename(filename))[0]
+
+        with open(filename, 'r') as object_file:
+            reader = csv.DictReader(object_file)
+            header = reader.fieldnames
+            rows = list(reader)
+
+        with self.connection:
+            self.connection.execute("DELETE FROM fixtures WHERE season = ?", (season,))
+            self.connection.execute("DELETE FROM entries WHERE season = ?", (season,))
+
+            team_names = {row.get("TeamA") for row in rows} | {row.get("TeamB") for row in rows}
+            team_ids = self._ids("teams", team_names)
+            player_ids = self._ids("players", header[5:])
+            self.connection.executemany("INSERT INTO entries (season, player_id) VALUES (?, ?)",
+                                        [(season, player_ids[player_name]) for player_name in header[5:]])
+
+            next_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM fixtures").fetchone()[0]
+            fixtures = []
+            predictions = []
+            for fixture_id, row in enumerate(rows, next_id):
+                goals_a, goals_b = self._goals(row.get("Score"))
+                played_on = datetime.datetime.strptime(row.get("When"), "%d/%m/%Y").strftime("%Y-%m-%d")
+                fixtures.append((fixture_id, season, row.get("Group"), team_ids[row.get("TeamA")],
+                                 team_ids[row.get("TeamB")], played_on, goals_a, goals_b))
+
+                # Blank predictions simply don't get a row
+                for player_name in header[5:]:
+                    predicted_a, predicted_b = model.parse_goals(row.get(player_name))
+                    if predicted_a >= 0 and predicted_b >= 0:
+                        predictions.append((fixture_id, player_ids[player_name], predicted_a, predicted_b))
+
+            self.connection.executemany("INSERT INTO fixtures VALUES (?, ?, ?, ?, ?, ?, ?, ?)", fixtures)
+            self.connection.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?)", predictions)
+
+        return len(fixtures)
+
+    def _ids(self, table: str, names):
+        self.connection.executemany("INSERT OR IGNORE INTO {0} (name) VALUES (?)".format(table),
+                                    [(name,) for name in names])
+        return dict((name, row_id) for row_id, name in self.connection.execute("SELECT id, name FROM {0}".format(table)))
+
+    @staticmethod
+    def _goals(score: str):
+        goals_a, goals_b = model.parse_goals(score)
+        if goals_a < 0 or goals_b < 0:
+            return None, None
+        return goals_a, goals_b
+
+    def seasons(self):
+        return [season for season, in self.connection.execute("SELECT DISTINCT season FROM fixtures ORDER BY season")]
+
+    def players(self, season: str):
+        return [name for name, in self.connection.execute(
+            "SELECT p.name FROM entries e JOIN players p ON p.id = e.player_id WHERE e.season = ? ORDER BY p.id",
+            (season,))]
+
+    def groups(self, season: str):
+        '''The names of the teams in each group of the season'''
+        groups = {}
+        for group, team_name in self.connection.execute(
+                "SELECT f.grp, t.name FROM fixtures f JOIN teams t ON t.id IN (f.team_a_id, f.team_b_id) "
+                "WHERE f.season = ? GROUP BY f.grp, t.name", (season,)):
+            groups.setdefault(group, set()).add(team_name)
+        return groups
+
+    def teams(self, season: str, as_of: datetime.datetime = None, group: str = None):
+        '''Each team's record from the results played up to the end of the as of date, optionally just for
+        the teams in one group'''
+
+        teams = {}
+        for team_names in self.groups(season).values():
+            for team_name in team_names:
+                teams[team_name] = model.Team(team_name)
+
+        query = """
+            WITH results (team_id, goals_for, goals_against) AS (
+                SELECT team_a_id, goals_a, goals_b FROM fixtures
+                WHERE season = :season AND goals_a IS NOT NULL AND played_on <= :as_of
+                UNION ALL
+                SELECT team_b_id, goals_b, goals_a FROM fixtures
+                WHERE season = :season AND goals_a IS NOT NULL AND played_on <= :as_of)
+            SELECT t.name, SUM(goals_for > goals_against), SUM(goals_for = goals_against),
+                   SUM(goals_for < goals_against), SUM(goals_for), SUM(goals_against)
+            FROM results r JOIN teams t ON t.id = r.team_id
+            GROUP BY t.name"""
+
+        for team_name, won, drawn, lost, goals_for, goals_against in self.connection.execute(
+                query, {"season": season, "as_of": self._date(as_of)}):
+            team = teams[team_name]
+            team.won, team.drawn, team.lost = won, drawn, lost
+            team.goals_for, team.goals_against = goals_for, goals_against
+
+        if group is not None:
+            teams = {team_name: teams[team_name] for team_name in self.groups(season)[group]}
+
+        return teams
+
+    def fixtures(self, season: str, group: str = None, as_of: datetime.datetime = None, teams: dict = None):
+        '''The season's fixtures as Fixture objects, optionally for just one group and up to an as of date'''
+
+        if teams is None:
+            teams = {}
+
+        fixtures = []
+        for group, team_a_name, team_b_name, played_on, goals_a, goals_b in self.connection.execute(
+                "SELECT f.grp, a.name, b.name, f.played_on, f.goals_a, f.goals_b FROM fixtures f "
+                "JOIN teams a ON a.id = f.team_a_id JOIN teams b ON b.id = f.team_b_id "
+                "WHERE f.season = :season AND (:grp IS NULL OR f.grp = :grp) AND f.played_on <= :as_of "
+                "ORDER BY f.played_on, f.id", {"season": season, "grp": group, "as_of": self._date(as_of)}):
+            team_a = teams.setdefault(team_a_name, model.Team(team_a_name))
+            team_b = teams.setdefault(team_b_name, model.Team(team_b_name))
+            fixture = model.Fixture(team_a, team_b, datetime.datetime.strptime(played_on, "%Y-%m-%d"), group)
+            if goals_a is not None:
+                fixture.score = model.Score.from_goals(goals_a, goals_b)
+            fixtures.append(fixture)
+
+        return fixtures
+
+    def points_sql(self):
+        '''SQL expression for the points scored by prediction p for fixture f under the scoring scheme'''
+
+        result_a = "((f.goals_a > f.goals_b) - (f.goals_a < f.goals_b))"
+        result_p = "((p.goals_a > p.goals_b) - (p.goals_a < p.goals_b))"
+
+        correct = str(int(self.scheme.correct))
+        if isinstance(self.scheme, model.GoalDifferenceScoringScheme):
+            correct = "{0} + CASE WHEN f.goals_a - f.goals_b = p.goals_a - p.goals_b THEN {1} ELSE 0 END".format(
+                correct, int(self.scheme.bonus))
+
+        return ("CASE WHEN f.goals_a IS NULL OR p.goals_a IS NULL THEN 0 "
+                "WHEN f.goals_a = p.goals_a AND f.goals_b = p.goals_b THEN {0} "
+                "WHEN {1} = {2} THEN {3} ELSE {4} END").format(int(self.scheme.exact), result_a, result_p,
+                                                                correct, int(self.scheme.wrong))
+
+    def scores(self, season: str, as_of: datetime.datetime = None):
+        '''Each player's total points up to the end of the as of date'''
+
+        scores = {player_name: 0 for player_name in self.players(season)}
+        query = """
+            SELECT pl.name, SUM({0}) FROM fixtures f
+            JOIN predictions p ON p.fixture_id = f.id
+            JOIN players pl ON pl.id = p.player_id
+            WHERE f.season = ? AND f.played_on <= ?
+            GROUP BY pl.name""".format(self.points_sql())
+        for player_name, points in self.connection.execute(query, (season, self._date(as_of))):
+            scores[player_name] = points
+
+        return scores
+
+    def score_details(self, season: str, as_of: datetime.datetime = None):
+        '''How many played fixtures each player scored each number of points for'''
+
+        details = {player_name: {} for player_name in self.players(season)}
+        query = """
+            SELECT pl.name, {0} AS points, COUNT(*) FROM fixtures f
+            JOIN entries e ON e.season = f.season
+            JOIN players pl ON pl.id = e.player_id
+            LEFT JOIN predictions p ON p.fixture_id = f.id AND p.player_id = e.player_id
+            WHERE f.season = ? AND f.played_on <= ? AND f.goals_a IS NOT NULL
+            GROUP BY pl.name, points""".format(self.points_sql())
+        for player_name, points, count in self.connection.execute(query, (season, self._date(as_of))):
+            details[player_name][points] = count
+
+        return details
+
+    def history(self, season: str):
+        '''(date, player, running total) for every date that each player made predictions for'''
+
+        query = """
+            SELECT f.played_on, pl.name, SUM(SUM({0})) OVER (PARTITION BY pl.id ORDER BY f.played_on)
+            FROM fixtures f
+            JOIN predictions p ON p.fixture_id = f.id
+            JOIN players pl ON pl.id = p.player_id
+            WHERE f.season = ?
+            GROUP BY f.played_on, pl.id
+            ORDER BY f.played_on, pl.id""".format(self.points_sql())
+
+        return [(datetime.datetime.strptime(played_on, "%Y-%m-%d"), player_name, points)
+                for played_on, player_name, points in self.connection.execute(query, (season,))]
+
+    def predictions(self, season: str, player_name: str):
+        '''The player's predictions for every fixture of the season with the points that each one scored'''
+
+        query = """
+            SELECT f.grp, a.name, b.name, f.played_on, p.goals_a, p.goals_b, {0} FROM fixtures f
+            JOIN players pl ON pl.name = :player
+            LEFT JOIN predictions p ON p.fixture_id = f.id AND p.player_id = pl.id
+            JOIN teams a ON a.id = f.team_a_id
+            JOIN teams b ON b.id = f.team_b_id
+            WHERE f.season = :season
+            ORDER BY f.grp, f.played_on, a.name""".format(self.points_sql())
+
+        teams = {}
+        for group, team_a_name, team_b_name, played_on, goals_a, goals_b, points in self.connection.execute(
+                query, {"season": season, "player": player_name}):
+            team_a = teams.setdefault(team_a_name, model.Team(team_a_name))
+            team_b = teams.setdefault(team_b_name, model.Team(team_b_name))
+            fixture = model.Fixture(team_a, team_b, datetime.datetime.strptime(played_on, "%Y-%m-%d"), group)
+            score = model.Score() if goals_a is None else model.Score.from_goals(goals_a, goals_b)
+            yield model.Prediction(fixture, score, points)
+
+    def _date(self, as_of: datetime.datetime = None):
+        return FixtureDatabase.END_OF_TIME if as_of is None else as_of.strftime("%Y-%m-%d")
+
+    def print_player_scores(self, season: str, as_of: datetime.datetime = None):
+
+        totals = self.scores(season, as_of)
+
+        hst = model.HighScoreTable("World Cup Predictor", max_size=None)
+        for player_name, points in totals.items():
+            hst.add(player_name, points)
+        hst.print()
+
+        model.print_prediction_details(totals, self.score_details(season, as_of), self.scheme.max_points)
+
+    def print_player_score_history(self, season: str):
+        print("Date;Player;Score")
+        for played_on, player_name, points in self.history(season):
+            print("{0};{1};{2}".format(datetime.datetime.strftime(played_on, "%d/%m/%Y"), player_name, points))
+
+    def print_groups(self, season: str, as_of: datetime.datetime = None):
+        print("\nGroups")
+        for group in sorted(list(self.groups(season).keys())):
+            teams = self.teams(season, as_of, group)
+            print("\nGroup {0}".format(group))
+            model.print_team_table(model.rank_teams(list(teams.values()), self.fixtures(season, group, as_of, teams)))
+        print("\n")
+
+    def print_teams(self, season: str, as_of: datetime.datetime = None):
+        teams = self.teams(season, as_of)
+        print("\nTeams")
+        model.print_team_table([teams[team_name] for team_name in sorted(list(teams.keys()))])
+        print("\n")
@@ -0,0 +1,147 @@
+import csv
+import datetime
+import hashlib
+import io
+import json
+import os
+
+import model
+
+
+class Exporter:
+    '''Writes standings, player scores, score breakdowns and score history as compact JSON and CSV files
+    for the results site. Only files whose contents have changed since the last export are rewritten.'''
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, factory: model.FixtureFactory, directory: str = "site", title: str = "World Cup Predictor"):
+        self.factory = factory
+        self.directory = directory
+        self.title = title
+        self.exported_version = None
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.directory, Exporter.MANIFEST)) as manifest_file:
+                return json.load(manifest_file)
+        except (IOError, ValueError):
+            return {"files": {}}
+
+    def attach(self):
+        '''Export again every time the factory's data changes'''
+        self.detach()
+        self.factory.subscribe(self.on_fixture_event)
+
+    def detach(self):
+        '''Stop exporting after every change'''
+        self.factory.unsubscribe(self.on_fixture_event)
+
+    def on_fixture_event(self, event: model.FixtureEvent):
+        self.export()
+
+    def datasets(self):
+        '''The contents of every exported file keyed by file name'''
+
+        timeline = self.factory.store.timeline()
+        players = self.factory.store.players
+        dates = [datetime.datetime.strftime(date, "%Y-%m-%d") for date in timeline.dates]
+        cumulative = timeline.cumulative()
+
+        files = {"standings.json": self._json(self.standings()),
+                 "teams.json": self._json(self.teams()),
+                 "scores.json": self._json(self.scores()),
+                 "score_details.json": self._json(self.score_details()),
+                 "history.json": self._json(self.history(timeline))}
+
+        # The same history as one column per player for spreadsheets and charting libraries
+        history = io.StringIO()
+        writer = csv.writer(history, lineterminator="\n")
+        writer.writerow(["Date"] + players)
+        for i, date in enumerate(dates):
+            writer.writerow([date] + cumulative[i].tolist())
+        files["history.csv"] = history.getvalue().encode("utf-8")
+
+        return files
+
+    @staticmethod
+    def _json(data):
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _team_row(team: model.Team):
+        return [team.name, team.played, team.won, team.drawn, team.lost,
+                team.goals_for, team.goals_against, team.goal_diff, team.points]
+
+    TEAM_COLUMNS = ["team", "played", "won", "drawn", "lost", "for", "against", "goal_diff", "points"]
+
+    def standings(self):
+
+        group_fixtures = {}
+        for fixture in self.factory.fixtures:
+            group_fixtures.setdefault(fixture.group, []).append(fixture)
+
+        groups = {}
+        for group in sorted(self.factory.groups.keys()):
+            teams = [self.factory.teams[team_name] for team_name in self.factory.groups[group]]
+            groups[group] = [self._team_row(team) for team in model.rank_teams(teams, group_fixtures.get(group, []))]
+
+        return {"columns": Exporter.TEAM_COLUMNS, "groups": groups}
+
+    def teams(self):
+        return {"columns": Exporter.TEAM_COLUMNS,
+                "rows": [self._team_row(self.factory.teams[team_name]) for team_name in sorted(self.factory.teams)]}
+
+    def scores(self):
+        hst = model.HighScoreTable(self.title, max_size=None)
+        for player_name, score in self.factory.scores.items():
+            hst.add(player_name, score)
+        return {"title": self.title,
+                "columns": ["rank", "player", "points"],
+                "rows": [[rank, player_name, score] for rank, player_name, score in hst.ranked()]}
+
+    def score_details(self):
+        details = {}
+        for player_name in sorted(self.factory.store.players):
+            breakdown = self.factory.score_details[player_name]
+            details[player_name] = {str(points): count for points, count in sorted(breakdown.items(), reverse=True)}
+        return {"max_points": self.factory.scheme.max_points, "players": details}
+
+    def history(self, timeline: model.Timeline = None):
+        if timeline is None:
+            timeline = self.factory.store.timeline()
+        return {"dates": [datetime.datetime.strftime(date, "%Y-%m-%d") for date in timeline.dates],
+                "players": self.factory.store.players,
+                "cumulative": timeline.cumulative().T.tolist()}
+
+    def export(self, force: bool = False):
+        '''Write any files whose contents have changed and return the names of the files written'''
+
+        if force is False and self.exported_version == self.factory.version:
+            return []
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        written = []
+        for file_name, contents in self.datasets().items():
+            digest = hashlib.sha256(contents).hexdigest()
+            path = os.path.join(self.directory, file_name)
+            if force is False and self.manifest["files"].get(file_name) == digest and os.path.exists(path):
+                continue
+
+            temp_path = path + ".tmp"
+            with open(temp_path, "wb") as export_file:
+                export_file.write(contents)
+            os.replace(temp_path, path)
+
+            self.manifest["files"][file_name] = digest
+            written.append(file_name)
+
+        if len(written) > 0:
+            self.manifest["updated"] = datetime.datetime.now().isoformat(timespec="seconds")
+            with open(os.path.join(self.directory, Exporter.MANIFEST), "w") as manifest_file:
+                json.dump(self.manifest, manifest_file, indent=1)
+
+        self.exported_version = self.factory.version
+
+        return written
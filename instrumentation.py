@@ -0,0 +1,139 @@
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+class Timer:
+    '''Context manager that adds the time spent inside it to a named stage'''
+
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats: "Stats", name: str):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoTimer:
+    '''Stands in for a Timer when instrumentation is switched off so that timing costs next to nothing'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NO_TIMER = _NoTimer()
+
+
+class Stats:
+    '''Opt-in counts and timings of named stages e.g. the steps of loading the fixtures or drawing a chart.
+    Nothing is recorded until the stats are enabled.'''
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def timer(self, name: str):
+        if self.enabled is False:
+            return NO_TIMER
+        return Timer(self, name)
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [1, seconds, seconds]
+            else:
+                stage[0] += 1
+                stage[1] += seconds
+                stage[2] = max(stage[2], seconds)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled is True:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+
+    def print(self):
+        print("\nInstrumentation ({0})".format("on" if self.enabled is True else "off"))
+        row_format = "{0:<40} {1:>8} {2:>12} {3:>12} {4:>12}"
+        print(row_format.format("Stage", "Calls", "Total ms", "Mean ms", "Max ms"))
+        for name in sorted(self.stages.keys(), key=lambda name: self.stages[name][1], reverse=True):
+            calls, total, longest = self.stages[name]
+            print(row_format.format(name, calls, "{0:.3f}".format(total * 1000),
+                                    "{0:.3f}".format(total * 1000 / calls), "{0:.3f}".format(longest * 1000)))
+        if len(self.counters) > 0:
+            print("\n{0:<40} {1:>8}".format("Counter", "Count"))
+            for name in sorted(self.counters.keys()):
+                print("{0:<40} {1:>8}".format(name, self.counters[name]))
+        print("\n")
+
+
+stats = Stats()
+
+
+def timed(name: str):
+    '''Decorator that times every call to a function as a stage'''
+
+    def decorator(function):
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if stats.enabled is False:
+                return function(*args, **kwargs)
+            with Timer(stats, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def profile(function, filename: str = "profile.prof", top: int = 15):
+    '''Run a function under cProfile and tracemalloc, dump the profile to a file for pstats or snakeviz and
+    print the slowest functions and the biggest allocations'''
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.enable()
+        try:
+            function()
+        finally:
+            profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    profiler.dump_stats(filename)
+
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(top)
+    print(output.getvalue())
+
+    print("Peak memory {0:.1f} MB. Biggest allocations:".format(peak / 1024 / 1024))
+    for statistic in snapshot.statistics("lineno")[:top]:
+        print("\t{0}".format(statistic))
+
+    print("\nProfile saved to {0}.".format(filename))
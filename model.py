@@ -1,58 +1,118 @@
+import bisect
 import csv
 import datetime
+import io
+import itertools
+import logging
 import os
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+
+import instrumentation
+import snapshot
+
+
+def _counter(attribute: str):
+    '''A team stats property that throws away the team's cached sort key whenever it is changed'''
+
+    def get_value(team):
+        return getattr(team, attribute)
+
+    def set_value(team, value):
+        setattr(team, attribute, value)
+        team._sort_key = None
+
+    return property(get_value, set_value)
 
 
 class Team:
+    __slots__ = ("name", "_won", "_lost", "_drawn", "_goals_for", "_goals_against", "_sort_key")
+
+    won = _counter("_won")
+    lost = _counter("_lost")
+    drawn = _counter("_drawn")
+    goals_for = _counter("_goals_for")
+    goals_against = _counter("_goals_against")
+
     def __init__(self, name):
         self.name = name
-        self.won = 0
-        self.lost = 0
-        self.drawn = 0
-        self.goals_for = 0
-        self.goals_against = 0
+        self._won = 0
+        self._lost = 0
+        self._drawn = 0
+        self._goals_for = 0
+        self._goals_against = 0
+        self._sort_key = None
 
     def __str__(self):
         return self.name
 
     @property
     def points(self):
-        return self.won * 3 + self.drawn
+        return self._won * 3 + self._drawn
 
     @property
     def played(self):
-        return self.won + self.drawn + self.lost
+        return self._won + self._drawn + self._lost
 
     @property
     def goal_diff(self):
-        return self.goals_for - self.goals_against
+        return self._goals_for - self._goals_against
+
+    @property
+    def sort_key(self):
+        '''Points, goal difference and goals scored, cached until the team's stats next change'''
+        if self._sort_key is None:
+            self._sort_key = (self.points, self.goal_diff, self._goals_for)
+        return self._sort_key
 
     def __lt__(self, other_team):
         assert isinstance(other_team, Team)
 
-        if self.points > other_team.points:
-            return False
-        elif self.points < other_team.points:
-            return True
+        if self.sort_key != other_team.sort_key:
+            return self.sort_key < other_team.sort_key
         else:
-            if self.goal_diff > other_team.goal_diff:
-                return False
-            elif self.goal_diff < other_team.goal_diff:
-                return True
-            elif self.goals_for < other_team.goals_for:
-                return True
-            else:
-                return self.name > other_team.name
+            return self.name > other_team.name
+
+
+def rank_teams(teams: list, fixtures: list = None):
+    '''Sort teams best first by points, goal difference and goals scored. If fixtures are given then teams
+    that are still level are separated by a mini table of the results between just those teams.'''
+
+    ranked = sorted(teams, reverse=True)
+    if fixtures is None:
+        return ranked
+
+    result = []
+    for sort_key, level in itertools.groupby(ranked, key=lambda team: team.sort_key):
+        level = list(level)
+        if len(level) > 1:
+            mini_table = {team.name: Team(team.name) for team in level}
+            for fixture in fixtures:
+                if fixture.team_a.name in mini_table.keys() and fixture.team_b.name in mini_table.keys():
+                    Fixture.apply_result(mini_table[fixture.team_a.name], mini_table[fixture.team_b.name],
+                                         fixture.score)
+            level.sort(key=lambda team: mini_table[team.name], reverse=True)
+        result += level
+
+    return result
 
 
 class Fixture:
-    def __init__(self, team_a: Team, team_b: Team, when: datetime, group: str = {"X"}, score: str = None):
+    __slots__ = ("team_a", "team_b", "when", "group", "score", "points", "_sort_key")
+
+    def __init__(self, team_a: Team, team_b: Team, when: datetime, group: str = "X", score: str = None):
         self.team_a = team_a
         self.team_b = team_b
-        self.when = datetime.datetime.strptime(when, "%d/%m/%Y")
+        if isinstance(when, datetime.datetime):
+            self.when = when
+        else:
+            self.when = datetime.datetime.strptime(when, "%d/%m/%Y")
         self.group = group
         self.score = Score(score)
         self.points = None
+        self._sort_key = (self.group, self.when, self.team_a.name)
 
     def __str__(self):
         str = "Group {4}: {0} {3} {1} [{2}]".format(self.team_a,
@@ -67,18 +127,7 @@ class Fixture:
 
     def __lt__(self, other_fixture):
         assert isinstance(other_fixture, Fixture)
-        if self.group < other_fixture.group:
-            return True
-        elif self.group > other_fixture.group:
-            return False
-        elif self.when < other_fixture.when:
-            return True
-        elif self.when > other_fixture.when:
-            return False
-        elif self.team_a.name < other_fixture.team_a.name:
-            return True
-        else:
-            return False
+        return self._sort_key < other_fixture._sort_key
 
     def is_played(self):
         if self.score.is_valid() is True:
@@ -86,27 +135,43 @@ class Fixture:
         else:
             return False
 
-    def calc_stats(self):
+    def calc_stats(self, undo: bool = False):
 
-        if self.score.is_valid() is True:
+        # Undoing a result takes its goals and win/draw/loss back off the teams
+        Fixture.apply_result(self.team_a, self.team_b, self.score, -1 if undo is True else 1)
+
+    @staticmethod
+    def apply_result(team_a: Team, team_b: Team, score: "Score", step: int = 1):
 
-            self.team_a.goals_for += self.score.score_a
-            self.team_a.goals_against += self.score.score_b
-            self.team_b.goals_for += self.score.score_b
-            self.team_b.goals_against += self.score.score_a
+        if score.is_valid() is True:
 
-            if self.score.result() == Score.WIN:
-                self.team_a.won += 1
-                self.team_b.lost += 1
-            elif self.score.result() == Score.DRAW:
-                self.team_a.drawn += 1
-                self.team_b.drawn += 1
-            if self.score.result() == Score.LOSE:
-                self.team_b.won += 1
-                self.team_a.lost += 1
+            team_a.goals_for += step * score.score_a
+            team_a.goals_against += step * score.score_b
+            team_b.goals_for += step * score.score_b
+            team_b.goals_against += step * score.score_a
+
+            result = score.result()
+            if result == Score.WIN:
+                team_a.won += step
+                team_b.lost += step
+            elif result == Score.DRAW:
+                team_a.drawn += step
+                team_b.drawn += step
+            elif result == Score.LOSE:
+                team_b.won += step
+                team_a.lost += step
+
+    def set_score(self, score: "Score"):
+        '''Replace the result of this fixture with an already parsed score, undoing the old result's effect on
+        the team stats'''
+        self.calc_stats(undo=True)
+        self.score = score
+        self.calc_stats()
 
 
 class Score:
+    __slots__ = ("score_a", "score_b")
+
     WIN = "win"
     DRAW = "draw"
     LOSE = "lose"
@@ -116,24 +181,30 @@ class Score:
     CORRECT = 1
     WRONG = 0
 
+    NO_SCORE = -1
+
+    # Goals are stored as int8 and the scores are written with at most two digits a side
+    MAX_GOALS = 99
+
     def __init__(self, score: str = None):
+        self.score_a, self.score_b = parse_goals(score)
 
-        if score is not None and score.find(":") > 0:
-            a, b = score.split(":")
-            self.score_a = int(a)
-            self.score_b = int(b)
-        else:
-            self.score_a = "-"
-            self.score_b = "-"
+    @classmethod
+    def from_goals(cls, score_a: int, score_b: int):
+        '''Create a score from a pair of goal counts where a negative count means no score'''
+        score = cls()
+        if score_a >= 0 and score_b >= 0:
+            score.score_a = int(score_a)
+            score.score_b = int(score_b)
+        return score
 
     def __str__(self):
+        if self.is_valid() is False:
+            return "-:-"
         return "{0}:{1}".format(self.score_a, self.score_b)
 
     def is_valid(self):
-        if self.score_a == "-" or self.score_b == "-":
-            return False
-        else:
-            return True
+        return self.score_a >= 0 and self.score_b >= 0
 
     def result(self):
 
@@ -160,6 +231,83 @@ class Score:
         return points
 
 
+class ScoringScheme:
+    '''Scores arrays of predicted goals against actual goals: EXACT points for the exact score,
+    CORRECT points for the right result and WRONG points for anything else'''
+
+    def __init__(self, exact: int = Score.EXACT, correct: int = Score.CORRECT, wrong: int = Score.WRONG):
+        self.exact = exact
+        self.correct = correct
+        self.wrong = wrong
+
+    @property
+    def max_points(self):
+        return self.exact
+
+    def score(self, actual_a, actual_b, predicted_a, predicted_b):
+        '''Return the points matrix for predicted goals indexed by [fixture, player] against
+        actual goals indexed by [fixture]. Negative goals are treated as blanks and score nothing.'''
+
+        actual_a, actual_b, predicted_a, predicted_b = self._broadcast(actual_a, actual_b, predicted_a, predicted_b)
+
+        valid = (actual_a >= 0) & (actual_b >= 0) & (predicted_a >= 0) & (predicted_b >= 0)
+        exact = valid & (actual_a == predicted_a) & (actual_b == predicted_b)
+        correct = valid & (np.sign(actual_a - actual_b) == np.sign(predicted_a - predicted_b))
+
+        points = np.where(exact, self.exact, np.where(correct, self.correct, self.wrong))
+
+        # Blank predictions and unplayed fixtures never score anything
+        return np.where(valid, points, 0).astype(np.int16)
+
+    def compare(self, actual: Score, predicted: Score):
+        '''Score a single prediction with the same rules as the batch scorer, so a blank prediction or an
+        unplayed fixture scores nothing'''
+        if actual.is_valid() is False or predicted.is_valid() is False:
+            return 0
+        points = self.score(np.array([actual.score_a]), np.array([actual.score_b]),
+                            np.array([[predicted.score_a]]), np.array([[predicted.score_b]]))
+        return int(points[0, 0])
+
+    @staticmethod
+    def _broadcast(actual_a, actual_b, predicted_a, predicted_b):
+
+        # Widen to int16 so that goal differences can't overflow and line the
+        # actual goals up against each player's column of predictions
+        actual_a = np.asarray(actual_a, dtype=np.int16)
+        actual_b = np.asarray(actual_b, dtype=np.int16)
+        predicted_a = np.asarray(predicted_a, dtype=np.int16)
+        predicted_b = np.asarray(predicted_b, dtype=np.int16)
+
+        if actual_a.ndim < predicted_a.ndim:
+            actual_a = actual_a[..., np.newaxis]
+            actual_b = actual_b[..., np.newaxis]
+
+        return actual_a, actual_b, predicted_a, predicted_b
+
+
+class GoalDifferenceScoringScheme(ScoringScheme):
+    '''As ScoringScheme but with bonus points for a correct result with the right goal difference'''
+
+    def __init__(self, bonus: int = 1, **kwargs):
+        super(GoalDifferenceScoringScheme, self).__init__(**kwargs)
+        self.bonus = bonus
+
+    @property
+    def max_points(self):
+        return max(self.exact, self.correct + self.bonus)
+
+    def score(self, actual_a, actual_b, predicted_a, predicted_b):
+
+        points = super(GoalDifferenceScoringScheme, self).score(actual_a, actual_b, predicted_a, predicted_b)
+        actual_a, actual_b, predicted_a, predicted_b = self._broadcast(actual_a, actual_b, predicted_a, predicted_b)
+
+        # Exact scores already have the right goal difference so only top up the correct results
+        same_diff = (actual_a - actual_b) == (predicted_a - predicted_b)
+        bonus = (points == self.correct) & same_diff & (actual_a != predicted_a)
+
+        return np.where(bonus, points + self.bonus, points).astype(np.int16)
+
+
 class Player:
     def __init__(self, name: str):
         self.name = name
@@ -167,224 +315,1106 @@ class Player:
         self.exact_result = 0
 
 
+class Prediction(Fixture):
+    '''A player's predicted score for a fixture, built on demand from a PredictionStore cell'''
+
+    __slots__ = ()
+
+    def __init__(self, fixture: Fixture, score: Score, points: int):
+        self.team_a = fixture.team_a
+        self.team_b = fixture.team_b
+        self.when = fixture.when
+        self.group = fixture.group
+        self.score = score
+        self.points = points
+        self._sort_key = fixture._sort_key
+
+
+def parse_goals(score: str):
+    '''Parse a "hh:mm" score string into a pair of goal counts or NO_SCORE sentinels'''
+    if score is not None and score.find(":") > 0:
+        a, b = score.split(":")
+        goals = int(a), int(b)
+        if not all(0 <= count <= Score.MAX_GOALS for count in goals):
+            raise ValueError("{0} is not a valid score, each side must be from 0 to {1} goals".format(
+                score, Score.MAX_GOALS))
+        return goals
+    else:
+        return Score.NO_SCORE, Score.NO_SCORE
+
+
+def parse_goals_array(scores):
+    '''Parse a sequence of "hh:mm" score strings into two int8 arrays of goal counts, parsing each
+    distinct string only once and then looking every cell up by its position in the distinct strings'''
+    distinct = {score: i for i, score in enumerate(set(scores))}
+    goals = np.array([parse_goals(score) for score in distinct.keys()], dtype=np.int8).reshape((-1, 2))
+    indices = np.fromiter(map(distinct.__getitem__, scores), dtype=np.intp, count=len(scores))
+    return goals[indices, 0], goals[indices, 1]
+
+
+def parse_goals_block(block: bytes, count: int):
+    '''Parse a block of count comma separated "hh:mm" scores or blanks into two int8 arrays of goal counts
+    without looking at each score in Python. Returns None if the block holds anything but one or two digit
+    goals so that it can be parsed score by score instead.'''
+
+    if len(block.translate(None, b"0123456789,:")) > 0:
+        return None
+
+    # Pad the end so that looking a few bytes past the start of the last score stays in bounds
+    data = np.frombuffer(block + b",,,", dtype=np.uint8)
+    size = len(block)
+    commas = np.flatnonzero(data[:size] == ord(","))
+    if len(commas) != count - 1:
+        return None
+
+    starts = np.empty(count, dtype=np.intp)
+    starts[0] = 0
+    starts[1:] = commas + 1
+    lengths = np.append(commas, size) - starts
+
+    # Every score that isn't blank must have exactly one colon with one or two digits either side of it
+    filled = np.flatnonzero(lengths > 0)
+    starts = starts[filled]
+    colon = np.where(data[starts + 1] == ord(":"), 1, np.where(data[starts + 2] == ord(":"), 2, 0))
+    length_b = lengths[filled] - colon - 1
+    if block.count(b":") != len(filled) or np.any((colon == 0) | (length_b < 1) | (length_b > 2)):
+        return None
+
+    digit = lambda positions: data[positions].astype(np.int8) - ord("0")
+    starts_b = starts + colon + 1
+    predicted_a = np.full(count, Score.NO_SCORE, dtype=np.int8)
+    predicted_b = np.full(count, Score.NO_SCORE, dtype=np.int8)
+    predicted_a[filled] = np.where(colon == 2, digit(starts) * 10 + digit(starts + 1), digit(starts))
+    predicted_b[filled] = np.where(length_b == 2, digit(starts_b) * 10 + digit(starts_b + 1), digit(starts_b))
+
+    return predicted_a, predicted_b
+
+
+class FixtureColumns:
+    '''A fixtures file read in bulk as columns rather than a dict per row. Dates are parsed once for each
+    distinct date and all of the predictions are parsed as one block straight into int8 goal arrays.
+    Files with quoted or ragged rows are read with the csv module and parsed a distinct score at a time.'''
+
+    def __init__(self, filename: str):
+
+        stats = instrumentation.stats
+
+        with stats.timer("load.read_csv"):
+            with open(filename, 'r', newline='') as object_file:
+                text = object_file.read()
+
+            lines = (text.replace("\r\n", "\n") if text.find("\r") >= 0 else text).split("\n")
+            header = next(csv.reader(lines[:1]))
+            players = header[5:]
+
+            # Unquoted rows with a field for every column are just split on commas, keeping all of the
+            # predictions as one block of text. Anything else is read a field at a time by the csv module.
+            rows = None
+            if text.find('"', len(lines[0])) < 0:
+                rows = [line.split(",", 5) for line in lines[1:] if line != ""]
+                if any(len(row) < 5 or (len(players) > 0 and (len(row) < 6 or row[5].count(",") != len(players) - 1))
+                       for row in rows):
+                    rows = None
+
+            count = len(players) * (len(rows) if rows is not None else 0)
+            if rows is not None:
+                cells = ",".join(row[5] for row in rows) if count > 0 else []
+            else:
+                # Pad short rows with blanks and drop extra fields as DictReader would
+                width = len(header)
+                reader = csv.reader(io.StringIO(text))
+                next(reader)
+                rows = [(row + [""] * (width - len(row)))[:width] for row in reader if len(row) > 0]
+                cells = list(itertools.chain.from_iterable(row[5:] for row in rows))
+                count = len(cells)
+
+        columns = list(zip(*rows)) if len(rows) > 0 else [()] * 5
+        self.groups, self.team_a, self.team_b = columns[0], columns[1], columns[2]
+
+        with stats.timer("load.parse_dates"):
+            dates = {when: datetime.datetime.strptime(when, "%d/%m/%Y") for when in set(columns[3])}
+            self.when = [dates[when] for when in columns[3]]
+
+        with stats.timer("load.parse_predictions"):
+            self.actual_a, self.actual_b = parse_goals_array(columns[4])
+
+            goals = None
+            if isinstance(cells, str):
+                if cells.isascii() is True:
+                    goals = parse_goals_block(cells.encode("ascii"), count)
+                cells = cells.split(",") if goals is None else None
+            if goals is None:
+                goals = parse_goals_array(cells)
+
+            predicted_a = goals[0].reshape((len(rows), len(players)))
+            predicted_b = goals[1].reshape((len(rows), len(players)))
+
+            # Where a player's name appears twice the last column wins as it does with DictReader
+            last_column = {player_name: i for i, player_name in enumerate(players)}
+            self.players = list(last_column.keys())
+            if len(self.players) < len(players):
+                predicted_a = predicted_a[:, list(last_column.values())]
+                predicted_b = predicted_b[:, list(last_column.values())]
+
+            self.predicted_a = np.ascontiguousarray(predicted_a)
+            self.predicted_b = np.ascontiguousarray(predicted_b)
+
+    def __len__(self):
+        return len(self.groups)
+
+
+class Timeline:
+    '''Sorted, interned match days with each player's points per day, indexed by [date, player]'''
+
+    def __init__(self, ordinals, points, predicted):
+
+        ordinals = np.asarray(ordinals)
+        unique, inverse = np.unique(ordinals, return_inverse=True)
+
+        self.dates = [datetime.datetime.fromordinal(int(ordinal)) for ordinal in unique]
+        self.date_index = {ordinal: i for i, ordinal in enumerate(unique.tolist())}
+        self.fixture_dates = inverse.astype(np.int32).reshape(-1)
+
+        players = points.shape[1]
+        self.daily_points = np.zeros((len(self.dates), players), dtype=np.int32)
+        self.daily_predictions = np.zeros((len(self.dates), players), dtype=np.int32)
+        np.add.at(self.daily_points, self.fixture_dates, points)
+        np.add.at(self.daily_predictions, self.fixture_dates, predicted)
+
+        self._cumulative = None
+
+    def add_fixture(self, ordinal: int):
+        '''Map a new fixture row onto its date, returning False if that date is not on the timeline yet'''
+        if ordinal not in self.date_index.keys():
+            return False
+        self.fixture_dates = np.append(self.fixture_dates, np.int32(self.date_index[ordinal]))
+        return True
+
+    def update(self, row: int, points, predicted, step: int = 1):
+        '''Add (or with step=-1 take away) one fixture row's points and predictions'''
+        date = self.fixture_dates[row]
+        self.daily_points[date] += step * points.astype(np.int32)
+        self.daily_predictions[date] += step * predicted.astype(np.int32)
+        self._cumulative = None
+
+    def cumulative(self):
+        '''Running total of each player's points at the end of each date'''
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self.daily_points, axis=0)
+        return self._cumulative
+
+    def index_as_of(self, when: datetime.datetime):
+        '''Index of the last date on or before the specified date, or -1 if it is before the first date'''
+        return bisect.bisect_right(self.dates, when) - 1
+
+
+class TeamHistory:
+    '''Prefix sums of every team's counters at the end of each date on a Timeline, indexed by [date, team]'''
+
+    COUNTERS = ("won", "drawn", "lost", "goals_for", "goals_against")
+
+    def __init__(self, team_names: list, team_a, team_b, actual_a, actual_b, timeline: Timeline):
+
+        self.team_names = list(team_names)
+        self.timeline = timeline
+
+        actual_a = np.asarray(actual_a, dtype=np.int32)
+        actual_b = np.asarray(actual_b, dtype=np.int32)
+        played = (actual_a >= 0) & (actual_b >= 0)
+        won = played & (actual_a > actual_b)
+        drawn = played & (actual_a == actual_b)
+        lost = played & (actual_a < actual_b)
+        goals_a = np.where(played, actual_a, 0)
+        goals_b = np.where(played, actual_b, 0)
+
+        # Each fixture changes the counters of its two teams on its date
+        daily = np.zeros((len(timeline.dates), len(self.team_names), len(TeamHistory.COUNTERS)), dtype=np.int32)
+        np.add.at(daily, (timeline.fixture_dates, team_a), np.column_stack((won, drawn, lost, goals_a, goals_b)))
+        np.add.at(daily, (timeline.fixture_dates, team_b), np.column_stack((lost, drawn, won, goals_b, goals_a)))
+
+        self.checkpoints = np.cumsum(daily, axis=0)
+
+    def teams_as_of(self, when: datetime.datetime):
+        '''A new Team object for each team with its counters as they were at the end of the specified date'''
+
+        i = self.timeline.index_as_of(when)
+
+        teams = {}
+        for t, team_name in enumerate(self.team_names):
+            team = Team(team_name)
+            if i >= 0:
+                team.won, team.drawn, team.lost, team.goals_for, team.goals_against = self.checkpoints[i, t].tolist()
+            teams[team_name] = team
+
+        return teams
+
+
+class PredictionStore:
+    '''Columnar store of actual and predicted goals indexed by [fixture, player]'''
+
+    NO_SCORE = Score.NO_SCORE
+
+    def __init__(self, capacity: int = 64):
+        self.players = []
+        self.player_index = {}
+        self.fixture_count = 0
+
+        self.actual_a = np.full(capacity, PredictionStore.NO_SCORE, dtype=np.int8)
+        self.actual_b = np.full(capacity, PredictionStore.NO_SCORE, dtype=np.int8)
+        self.predicted_a = np.full((capacity, 0), PredictionStore.NO_SCORE, dtype=np.int8)
+        self.predicted_b = np.full((capacity, 0), PredictionStore.NO_SCORE, dtype=np.int8)
+        self.points = np.zeros((capacity, 0), dtype=np.int16)
+        self.when = np.zeros(capacity, dtype=np.int32)
+        self._timeline = None
+
+    def add_player(self, player_name: str):
+
+        if player_name in self.player_index.keys():
+            return self.player_index[player_name]
+
+        self.player_index[player_name] = len(self.players)
+        self.players.append(player_name)
+
+        # Add a blank column for the new player
+        rows = self.predicted_a.shape[0]
+        blank = np.full((rows, 1), PredictionStore.NO_SCORE, dtype=np.int8)
+        self.predicted_a = np.hstack((self.predicted_a, blank))
+        self.predicted_b = np.hstack((self.predicted_b, blank))
+        self.points = np.hstack((self.points, np.zeros((rows, 1), dtype=np.int16)))
+        self._timeline = None
+
+        return self.player_index[player_name]
+
+    def add_players(self, player_names: list):
+        '''Add any of the players that are new with one blank column each, widening the arrays just once'''
+
+        new_players = [player_name for player_name in dict.fromkeys(player_names) if player_name not in self.player_index.keys()]
+        if len(new_players) > 0:
+            for player_name in new_players:
+                self.player_index[player_name] = len(self.players)
+                self.players.append(player_name)
+
+            rows = self.predicted_a.shape[0]
+            blank = np.full((rows, len(new_players)), PredictionStore.NO_SCORE, dtype=np.int8)
+            self.predicted_a = np.hstack((self.predicted_a, blank))
+            self.predicted_b = np.hstack((self.predicted_b, blank))
+            self.points = np.hstack((self.points, np.zeros((rows, len(new_players)), dtype=np.int16)))
+            self._timeline = None
+
+        return [self.player_index[player_name] for player_name in player_names]
+
+    def add_fixture(self, actual: tuple, predicted: list, when: datetime.datetime):
+        '''Append a row of actual goals and a list of predicted goal pairs in player order'''
+
+        if self.fixture_count == self.actual_a.shape[0]:
+            self._grow()
+
+        row = self.fixture_count
+        self.actual_a[row], self.actual_b[row] = actual
+        if len(predicted) > 0:
+            self.predicted_a[row], self.predicted_b[row] = zip(*predicted)
+        self.when[row] = when.toordinal()
+        self.fixture_count += 1
+
+        # A fixture on a new date shifts the timeline so it gets rebuilt when it is next needed
+        if self._timeline is not None:
+            if self._timeline.add_fixture(int(self.when[row])) is True:
+                self._track(row)
+            else:
+                self._timeline = None
+
+        return row
+
+    def _grow(self):
+
+        # Double the number of rows available in every array
+        rows = max(1, self.actual_a.shape[0])
+        sentinel = PredictionStore.NO_SCORE
+        self.actual_a = np.concatenate((self.actual_a, np.full(rows, sentinel, dtype=np.int8)))
+        self.actual_b = np.concatenate((self.actual_b, np.full(rows, sentinel, dtype=np.int8)))
+        blank = np.full((rows, len(self.players)), sentinel, dtype=np.int8)
+        self.predicted_a = np.vstack((self.predicted_a, blank))
+        self.predicted_b = np.vstack((self.predicted_b, blank))
+        self.points = np.vstack((self.points, np.zeros((rows, len(self.players)), dtype=np.int16)))
+        self.when = np.concatenate((self.when, np.zeros(rows, dtype=np.int32)))
+
+    def score(self, scheme: "ScoringScheme" = None):
+        '''Score every prediction against the actual results in one vectorized pass'''
+
+        if scheme is None:
+            scheme = ScoringScheme()
+
+        n = self.fixture_count
+        self.points[:n] = scheme.score(self.actual_a[:n], self.actual_b[:n], self.predicted_a[:n], self.predicted_b[:n])
+        self._timeline = None
+
+    @instrumentation.timed("store.timeline")
+    def timeline(self):
+        '''The match day timeline, built once and then kept up to date as rows are re-scored'''
+        if self._timeline is None:
+            n = self.fixture_count
+            predicted = (self.predicted_a[:n] >= 0) & (self.predicted_b[:n] >= 0)
+            self._timeline = Timeline(self.when[:n], self.points[:n], predicted)
+        return self._timeline
+
+    def _track(self, row: int, step: int = 1):
+        if self._timeline is not None:
+            predicted = (self.predicted_a[row] >= 0) & (self.predicted_b[row] >= 0)
+            self._timeline.update(row, self.points[row], predicted, step)
+
+    def _untrack(self, row: int):
+        self._track(row, step=-1)
+
+    @instrumentation.timed("store.totals")
+    def totals(self):
+        '''Total points for each player in player order'''
+        return self.points[:self.fixture_count].sum(axis=0)
+
+    @instrumentation.timed("store.details")
+    def details(self, col: int, rows=None):
+        '''How many played fixtures the player in the specified column scored each number of points for.
+        Optionally restricted to a boolean mask of fixture rows.'''
+        points = self.points[:self.fixture_count, col]
+        played = self.played()
+        if rows is not None:
+            points = points[rows]
+            played = played[rows]
+        details = {}
+        for point in np.unique(points):
+            details[int(point)] = int(np.count_nonzero(played & (points == point)))
+        return details
+
+    def played(self):
+        '''Boolean mask of the fixtures that have a valid actual result'''
+        n = self.fixture_count
+        return (self.actual_a[:n] >= 0) & (self.actual_b[:n] >= 0)
+
+    def predicted(self, player_name: str):
+        '''Boolean mask of the fixtures that the specified player has made a prediction for'''
+        n = self.fixture_count
+        col = self.player_index[player_name]
+        return (self.predicted_a[:n, col] >= 0) & (self.predicted_b[:n, col] >= 0)
+
+    def set_result(self, row: int, actual: tuple, scheme: "ScoringScheme" = None):
+        '''Record a new or corrected actual result and re-score just that fixture's row'''
+        self._untrack(row)
+        self.actual_a[row], self.actual_b[row] = actual
+        self._score_row(row, scheme)
+        self._track(row)
+
+    def set_predictions(self, row: int, predicted: list, scheme: "ScoringScheme" = None):
+        '''Replace a fixture's predicted goal pairs in player order and re-score just that row'''
+        self._untrack(row)
+        if len(predicted) > 0:
+            self.predicted_a[row], self.predicted_b[row] = zip(*predicted)
+        self._score_row(row, scheme)
+        self._track(row)
+
+    def set_cells(self, rows, cols, predicted_a, predicted_b, scheme: "ScoringScheme" = None):
+        '''Set individual predictions given as parallel arrays of fixture rows, player columns and goals,
+        then re-score just the fixture rows that were touched'''
+
+        touched = np.unique(rows)
+        for row in touched:
+            self._untrack(row)
+
+        self.predicted_a[rows, cols] = predicted_a
+        self.predicted_b[rows, cols] = predicted_b
+
+        if scheme is None:
+            scheme = ScoringScheme()
+        self.points[touched] = scheme.score(self.actual_a[touched], self.actual_b[touched],
+                                           self.predicted_a[touched], self.predicted_b[touched])
+
+        for row in touched:
+            self._track(row)
+
+    def rescore(self, row: int, scheme: "ScoringScheme" = None):
+        self._untrack(row)
+        self._score_row(row, scheme)
+        self._track(row)
+
+    def _score_row(self, row: int, scheme: "ScoringScheme" = None):
+
+        if scheme is None:
+            scheme = ScoringScheme()
+
+        self.points[row] = scheme.score(self.actual_a[row:row + 1], self.actual_b[row:row + 1],
+                                        self.predicted_a[row:row + 1], self.predicted_b[row:row + 1])[0]
+
+    def player_points(self, player_name: str):
+        return self.points[:self.fixture_count, self.player_index[player_name]]
+
+    def predicted_score(self, row: int, player_name: str):
+        col = self.player_index[player_name]
+        return Score.from_goals(self.predicted_a[row, col], self.predicted_b[row, col])
+
+    @classmethod
+    def from_arrays(cls, players: list, actual_a, actual_b, predicted_a, predicted_b, when):
+        '''Create a store around existing goal arrays e.g. ones memory-mapped from a snapshot'''
+        store = cls(capacity=0)
+        store.players = list(players)
+        store.player_index = {player_name: i for i, player_name in enumerate(store.players)}
+        store.fixture_count = len(actual_a)
+        store.actual_a = actual_a
+        store.actual_b = actual_b
+        store.predicted_a = predicted_a.reshape((len(actual_a), len(store.players)))
+        store.predicted_b = predicted_b.reshape((len(actual_a), len(store.players)))
+        store.points = np.zeros(store.predicted_a.shape, dtype=np.int16)
+        store.when = when
+        return store
+
+
+class PredictionsView(Mapping):
+    '''Read-only view of each player's predictions as a list of Prediction objects'''
+
+    def __init__(self, store: PredictionStore, fixtures: list):
+        self.store = store
+        self.fixtures = fixtures
+
+    def __getitem__(self, player_name: str):
+        if player_name not in self.store.player_index.keys():
+            raise KeyError(player_name)
+        points = self.store.player_points(player_name)
+        return [Prediction(self.fixtures[row], self.store.predicted_score(row, player_name), int(points[row]))
+                for row in range(self.store.fixture_count)]
+
+    def __iter__(self):
+        return iter(self.store.players)
+
+    def __len__(self):
+        return len(self.store.players)
+
+
+class ScoresView(Mapping):
+    '''Read-only view of each player's total points'''
+
+    def __init__(self, store: PredictionStore):
+        self.store = store
+
+    def __getitem__(self, player_name: str):
+        if player_name not in self.store.player_index.keys():
+            raise KeyError(player_name)
+        return int(self.store.player_points(player_name).sum())
+
+    def __iter__(self):
+        return iter(self.store.players)
+
+    def __len__(self):
+        return len(self.store.players)
+
+
+class ScoreDetailsView(Mapping):
+    '''Read-only view of how many played fixtures each player scored each number of points for'''
+
+    def __init__(self, store: PredictionStore):
+        self.store = store
+
+    def __getitem__(self, player_name: str):
+        if player_name not in self.store.player_index.keys():
+            raise KeyError(player_name)
+        return self.store.details(self.store.player_index[player_name])
+
+    def __iter__(self):
+        return iter(self.store.players)
+
+    def __len__(self):
+        return len(self.store.players)
+
+
+class FixtureEvent:
+    '''Notification of a change to the fixtures held by a FixtureFactory'''
+
+    ADDED = "added"
+    RESULT = "result"
+    PREDICTIONS = "predictions"
+    SUBMITTED = "submitted"
+    RELOADED = "reloaded"
+
+    def __init__(self, kind: str, fixture: Fixture = None, version: int = 0):
+        self.kind = kind
+        self.fixture = fixture
+        self.version = version
+
+    def __str__(self):
+        if self.fixture is None:
+            return "{0} (version {1})".format(self.kind, self.version)
+        return "{0}: {1} (version {2})".format(self.kind, self.fixture, self.version)
+
+
 class FixtureFactory:
-    def __init__(self):
+
+    DEFAULT_FILE = os.path.join(os.path.dirname(__file__), "data", "PL_fixtures.csv")
+    SNAPSHOT_SUFFIX = ".snap"
+    SUBMISSIONS_SUFFIX = ".predictions.csv"
+
+    def __init__(self, scheme: ScoringScheme = None):
+        self.scheme = scheme if scheme is not None else ScoringScheme()
+        self.filename = FixtureFactory.DEFAULT_FILE
+        self.subscribers = []
+        self.lock = threading.RLock()
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
         self.fixtures = []
-        self.predictions = {}
-        self.scores = {}
-        self.score_details = {}
+        self.store = PredictionStore()
+        self.predictions = PredictionsView(self.store, self.fixtures)
+        self.scores = ScoresView(self.store)
+        self.score_details = ScoreDetailsView(self.store)
         self.groups = {}
         self.teams = {}
+        self.fixture_index = {}
+        self._team_history = None
 
-    def load(self):
+    def subscribe(self, callback):
+        '''Register a callback to be called with a FixtureEvent whenever the fixtures change'''
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def notify(self, kind: str, fixture: Fixture = None):
+        self.version += 1
+        event = FixtureEvent(kind, fixture, self.version)
+        for callback in self.subscribers:
+            callback(event)
+
+    def load(self, filename: str = None, use_snapshot: bool = True):
         print("\nLoading fixtures...")
 
-        filename= os.path.join(os.path.dirname(__file__),"data", "PL_fixtures.csv")
+        if filename is not None:
+            self.filename = filename
 
-        # Attempt to open the file
-        with open(filename, 'r') as object_file:
+        stats = instrumentation.stats
 
-            # Load all rows in as a dictionary
-            reader = csv.DictReader(object_file)
+        # If there is an up to date snapshot of the file then use that instead of parsing it
+        if use_snapshot is True:
+            with stats.timer("load.read_snapshot"):
+                loaded = self.load_snapshot()
+            if loaded is True:
+                with stats.timer("load.submissions"):
+                    self.load_submissions()
+                print("\nFixtures loaded.")
+                return
 
-            # Get the list of column headers
-            header = reader.fieldnames
+        # Read the whole file in as columns and then build the fixtures from them
+        self.load_columns(FixtureColumns(self.filename))
 
-            # For each row in the file....
-            for row in reader:
-                # print(str(row))
-                group = row.get("Group")
-                team_a_name = row.get("TeamA")
-                team_b_name = row.get("TeamB")
-                when = row.get("When")
-                score = row.get("Score")
+        # Score every player's predictions in one go
+        with stats.timer("load.score_predictions"):
+            self.store.score(self.scheme)
+        self.version += 1
+
+        if use_snapshot is True:
+            with stats.timer("load.save_snapshot"):
+                self.save_snapshot()
+
+        with stats.timer("load.submissions"):
+            self.load_submissions()
+
+        print("\nFixtures loaded.")
+
+    def load_columns(self, columns: FixtureColumns):
+        '''Replace everything with the fixtures and predictions read in bulk from a fixtures file'''
+
+        self._reset()
+
+        with instrumentation.stats.timer("load.team_stats"):
+            for group, team_a_name, team_b_name, when, score_a, score_b in zip(
+                    columns.groups, columns.team_a, columns.team_b, columns.when,
+                    columns.actual_a.tolist(), columns.actual_b.tolist()):
 
                 if team_a_name not in self.teams.keys():
                     self.teams[team_a_name] = Team(team_a_name)
-
                 if team_b_name not in self.teams.keys():
                     self.teams[team_b_name] = Team(team_b_name)
 
-                team_a = self.teams[team_a_name]
-                team_b = self.teams[team_b_name]
-
-                result = Fixture(team_a, team_b, when, group, score)
-                result.calc_stats()
-                self.fixtures.append(result)
+                fixture = Fixture(self.teams[team_a_name], self.teams[team_b_name], when, group)
+                fixture.score = Score.from_goals(score_a, score_b)
+                fixture.calc_stats()
+                self._index_fixture(team_a_name, team_b_name, len(self.fixtures))
+                self.fixtures.append(fixture)
 
                 if group not in self.groups.keys():
                     self.groups[group] = set()
+                self.groups[group] |= {team_a_name, team_b_name}
 
-                self.groups[group] = self.groups[group] | {team_a_name, team_b_name}
+        when = np.array([fixture.when.toordinal() for fixture in self.fixtures], dtype=np.int32)
+        self._set_store(PredictionStore.from_arrays(columns.players, columns.actual_a, columns.actual_b,
+                                                    columns.predicted_a, columns.predicted_b, when))
+        instrumentation.stats.count("load.fixtures", len(columns))
 
-                # loop through all of the header fields except the first 5 columns...
-                for i in range(5, len(header)):
+    def _set_store(self, store: PredictionStore):
+        self.store = store
+        self.predictions = PredictionsView(self.store, self.fixtures)
+        self.scores = ScoresView(self.store)
+        self.score_details = ScoreDetailsView(self.store)
 
-                    player_name = header[i]
+    @property
+    def snapshot_filename(self):
+        return self.filename + FixtureFactory.SNAPSHOT_SUFFIX
+
+    def save_snapshot(self):
+        '''Save the parsed fixtures file as a binary snapshot keyed on the file's hash and modified time'''
+
+        team_names = list(self.teams.keys())
+        team_index = {team_name: i for i, team_name in enumerate(team_names)}
+        group_names = sorted(self.groups.keys())
+        group_index = {group: i for i, group in enumerate(group_names)}
+        n = self.store.fixture_count
+
+        meta = {"source": snapshot.file_key(self.filename),
+                "players": self.store.players,
+                "teams": team_names,
+                "groups": group_names}
+
+        arrays = {"group": np.array([group_index[fixture.group] for fixture in self.fixtures], dtype=np.int16),
+                  "team_a": np.array([team_index[fixture.team_a.name] for fixture in self.fixtures], dtype=np.int16),
+                  "team_b": np.array([team_index[fixture.team_b.name] for fixture in self.fixtures], dtype=np.int16),
+                  "when": np.array([fixture.when.toordinal() for fixture in self.fixtures], dtype=np.int32),
+                  "team_stats": np.array([[team.won, team.drawn, team.lost, team.goals_for, team.goals_against]
+                                          for team in self.teams.values()], dtype=np.int32).reshape((-1, 5)),
+                  "actual_a": self.store.actual_a[:n],
+                  "actual_b": self.store.actual_b[:n],
+                  "predicted_a": self.store.predicted_a[:n],
+                  "predicted_b": self.store.predicted_b[:n]}
 
-                    # Get the next field name from the header row
-                    predicted_score = row.get(player_name)
+        try:
+            snapshot.write_snapshot(self.snapshot_filename, meta, arrays)
+            logging.info("%s saved." % self.snapshot_filename)
+        except IOError as err:
+            logging.warning("Unable to save snapshot %s: %s" % (self.snapshot_filename, str(err)))
 
-                    if player_name not in self.predictions.keys():
-                        self.predictions[player_name] = []
+    def load_snapshot(self):
+        '''Map in the snapshot of the fixtures file if it is still current. Returns True if it was loaded.'''
 
-                    if player_name not in self.scores.keys():
-                        self.scores[player_name] = 0
+        try:
+            meta, arrays = snapshot.read_snapshot(self.snapshot_filename)
+        except (IOError, snapshot.SnapshotError) as err:
+            logging.info("No snapshot loaded: %s" % str(err))
+            return False
 
-                    if player_name not in self.score_details.keys():
-                        self.score_details[player_name] = {}
+        if snapshot.is_current(meta.get("source"), self.filename) is False:
+            logging.info("%s is out of date." % self.snapshot_filename)
+            return False
 
-                    prediction = Fixture(team_a, team_b, when, group, predicted_score)
-                    actual = Score(score)
-                    predo = Score(predicted_score)
-                    points = actual.compare(predo)
+        self._reset()
+
+        # Put the teams back with their stats rather than re-running each fixture's calc_stats()
+        teams = []
+        for team_name, stats in zip(meta["teams"], arrays["team_stats"].tolist()):
+            team = Team(team_name)
+            team.won, team.drawn, team.lost, team.goals_for, team.goals_against = stats
+            self.teams[team_name] = team
+            teams.append(team)
+
+        dates = {}
+        groups = meta["groups"]
+        columns = zip(arrays["group"].tolist(), arrays["team_a"].tolist(), arrays["team_b"].tolist(),
+                      arrays["when"].tolist(), arrays["actual_a"].tolist(), arrays["actual_b"].tolist())
+        for group_id, team_a_id, team_b_id, ordinal, score_a, score_b in columns:
+            if ordinal not in dates.keys():
+                dates[ordinal] = datetime.datetime.fromordinal(ordinal)
+            team_a = teams[team_a_id]
+            team_b = teams[team_b_id]
+            group = groups[group_id]
+
+            fixture = Fixture(team_a, team_b, dates[ordinal], group)
+            fixture.score = Score.from_goals(score_a, score_b)
+            self._index_fixture(team_a.name, team_b.name, len(self.fixtures))
+            self.fixtures.append(fixture)
+
+            if group not in self.groups.keys():
+                self.groups[group] = set()
+            self.groups[group] |= {team_a.name, team_b.name}
+
+        self._set_store(PredictionStore.from_arrays(meta["players"], arrays["actual_a"], arrays["actual_b"],
+                                                     arrays["predicted_a"], arrays["predicted_b"], arrays["when"]))
+
+        self.store.score(self.scheme)
+        self.version += 1
+
+        return True
+
+    def reload(self):
+        '''Throw away everything and load the current file again from scratch'''
+        with self.lock:
+            self._reset()
+            self.load()
+            self.notify(FixtureEvent.RELOADED)
 
-                    if points not in self.score_details[player_name].keys():
-                        self.score_details[player_name][points] = 0
+    @property
+    def submissions_filename(self):
+        return self.filename + FixtureFactory.SUBMISSIONS_SUFFIX
 
-                    if actual.is_valid() is True:
-                        self.score_details[player_name][points] += 1
+    def load_submissions(self):
+        '''Apply the predictions that were submitted rather than typed into the fixtures file. They were all
+        checked when they were submitted so they are applied as they are, later submissions replacing earlier
+        ones, except where the fixtures file has its own prediction for the player and fixture, which wins.'''
 
-                    prediction.points = points
-                    self.scores[player_name] += points
-                    self.predictions[player_name].append(prediction)
-                    # print("Player {0} score {1}".format(player_name,self.scores[player_name]))
+        if os.path.exists(self.submissions_filename) is False:
+            return 0
 
-            # Close the file
-            object_file.close()
+        player_names, rows, goals = [], [], []
+        with open(self.submissions_filename, 'r') as object_file:
+            for submission in csv.DictReader(object_file):
+                key = (submission.get("TeamA"), submission.get("TeamB"))
+                if self.fixture_index.get(key) is not None:
+                    player_names.append(submission.get("Player"))
+                    rows.append(self.fixture_index[key])
+                    goals.append(parse_goals(submission.get("Score")))
 
-        print("\nFixtures loaded.")
+        # The store only holds the fixtures file's own predictions at this point
+        player_index = self.store.player_index
+        keep = [i for i, (player_name, row) in enumerate(zip(player_names, rows))
+                if player_name not in player_index.keys() or
+                self.store.predicted_a[row, player_index[player_name]] == PredictionStore.NO_SCORE]
 
-    def print(self):
+        if len(keep) > 0:
+            self.store.set_cells(np.array(rows)[keep], np.array(self.store.add_players([player_names[i] for i in keep])),
+                                 *np.array(goals, dtype=np.int8)[keep].T, scheme=self.scheme)
 
-        self.print_groups()
-        self.print_teams()
+        return len(keep)
 
-        print("\nResults")
-        for fixture in self.fixtures:
-            if fixture.is_played() is True:
-                print(fixture)
+    def apply_predictions(self, player_names: list, rows, predicted_a, predicted_b):
+        '''Set a batch of individual predictions and re-score only the fixtures they are for'''
+        with self.lock:
+            cols = np.array(self.store.add_players(player_names), dtype=np.intp)
+            self.store.set_cells(rows, cols, predicted_a, predicted_b, self.scheme)
+            self.notify(FixtureEvent.SUBMITTED)
 
-        print("\nPredictions")
-        for player in self.predictions.keys():
-            print("Player {0} predictions".format(player))
-            for prediction in self.predictions[player]:
-                print(prediction)
+    def add_fixture(self, row: dict, header: list):
+        '''Add a fixture and its predictions from a row of the fixtures file.
+        The predictions are not scored until the store is next scored.'''
 
-    def print_player_scores(self):
+        group = row.get("Group")
+        team_a_name = row.get("TeamA")
+        team_b_name = row.get("TeamB")
+        when = row.get("When")
+        score = row.get("Score")
 
-        hst = HighScoreTable("World Cup Predictor")
+        if team_a_name not in self.teams.keys():
+            self.teams[team_a_name] = Team(team_a_name)
 
-        for player in self.scores.keys():
-            # print("Player {0}: {1}".format(player, self.scores[player]))
-            hst.add(player, self.scores[player])
+        if team_b_name not in self.teams.keys():
+            self.teams[team_b_name] = Team(team_b_name)
 
-        hst.print()
+        team_a = self.teams[team_a_name]
+        team_b = self.teams[team_b_name]
 
-        print("\nPrediction Details:")
-        for player in sorted(list(self.score_details.keys())):
-            print("Player {0} predictions:".format(player))
-            for point in sorted(list(self.score_details[player].keys()), reverse=True):
-                count = self.score_details[player][point]
-                print("\tScore {0} x {1} = {2} pts".format(point, count, point * count))
-            matches = sum(list(self.score_details[player].values()))
-            print("\tTotal = {0} pts from {1} matches (Avg={2:.2}, Max points={3})".format(self.scores[player],matches,self.scores[player]/matches, matches*Score.EXACT))
+        result = Fixture(team_a, team_b, when, group, score)
+        result.calc_stats()
+        self._index_fixture(team_a_name, team_b_name, len(self.fixtures))
+        self.fixtures.append(result)
 
-        print("\n")
+        if group not in self.groups.keys():
+            self.groups[group] = set()
+
+        self.groups[group] = self.groups[group] | {team_a_name, team_b_name}
+
+        self.store.add_fixture(parse_goals(score), self._parse_predictions(row, header), result.when)
+
+        return result
+
+    def _parse_predictions(self, row: dict, header: list, index: int = None):
+
+        # loop through all of the header fields except the first 5 columns...
+        for i in range(5, len(header)):
+            self.store.add_player(header[i])
+
+        # ...and line the predictions up with the store's player columns, keeping any that were
+        # submitted for an existing fixture by players who aren't in the file
+        if index is None:
+            predicted = [(PredictionStore.NO_SCORE, PredictionStore.NO_SCORE)] * len(self.store.players)
+        else:
+            predicted = list(zip(self.store.predicted_a[index].tolist(), self.store.predicted_b[index].tolist()))
+        for i in range(5, len(header)):
+            player_name = header[i]
+            predicted[self.store.player_index[player_name]] = parse_goals(row.get(player_name))
+
+        return predicted
+
+    def append_fixture(self, row: dict, header: list):
+        '''Add and score a single new fixture row'''
+        with self.lock:
+            fixture = self.add_fixture(row, header)
+            self.store.rescore(len(self.fixtures) - 1, self.scheme)
+            self.notify(FixtureEvent.ADDED, fixture)
+
+        return fixture
+
+    def _index_fixture(self, team_a_name: str, team_b_name: str, row: int):
+        '''Index a fixture by its teams. A pairing that appears more than once e.g. a group game and a knockout
+        rematch is marked as ambiguous with None rather than pointing at only one of its fixtures.'''
+        key = (team_a_name, team_b_name)
+        self.fixture_index[key] = None if key in self.fixture_index.keys() else row
+
+    def find_row(self, team_a_name: str, team_b_name: str):
+        '''The row of the one fixture between the two teams'''
 
+        if (team_a_name, team_b_name) not in self.fixture_index.keys():
+            raise Exception("No fixture found for {0} v {1}.".format(team_a_name, team_b_name))
+
+        row = self.fixture_index[(team_a_name, team_b_name)]
+        if row is None:
+            raise Exception("There is more than one {0} v {1} fixture.".format(team_a_name, team_b_name))
+
+        return row
+
+    def update_result(self, team_a_name: str, team_b_name: str, score: str):
+        '''Apply a new or corrected result for a single fixture without reloading everything else'''
+        return self.update_result_row(self.find_row(team_a_name, team_b_name), score)
+
+    def update_result_row(self, row: int, score: str):
+        '''Apply a new or corrected result for the fixture in a row of the fixtures file'''
+
+        # Parse the score before anything is changed so that a bad one leaves the fixture as it was
+        goals = parse_goals(score)
+
+        with self.lock:
+            fixture = self.fixtures[row]
+
+            # Swap the result on the two teams and then re-score the one row of predictions
+            fixture.set_score(Score.from_goals(*goals))
+            self.store.set_result(row, goals, self.scheme)
+            self.notify(FixtureEvent.RESULT, fixture)
+
+        return fixture
+
+    def update_predictions(self, row: dict, header: list):
+        '''Replace the predictions for the fixture in a row of the fixtures file and re-score them'''
+        return self.update_predictions_row(self.find_row(row.get("TeamA"), row.get("TeamB")), row, header)
+
+    def update_predictions_row(self, index: int, row: dict, header: list):
+        '''Replace the predictions for the fixture at an index with those in a row of the fixtures file'''
+
+        with self.lock:
+            self.store.set_predictions(index, self._parse_predictions(row, header, index), self.scheme)
+            self.notify(FixtureEvent.PREDICTIONS, self.fixtures[index])
+
+        return self.fixtures[index]
+
+    @instrumentation.timed("factory.print")
+    def print(self, fixture_filter: "FixtureFilter" = None, page_size: int = None):
+
+        self.print_groups()
+        self.print_teams()
+
+        print_paged(self.lines(fixture_filter), page_size)
+
+    def lines(self, fixture_filter: "FixtureFilter" = None):
+        '''Generate the lines of the results and predictions listing, only formatting each one as it is needed'''
+
+        yield "\nResults"
+        for fixture in self.iter_results(fixture_filter):
+            yield str(fixture)
+
+        yield "\nPredictions"
+        for player in self.store.players:
+            if fixture_filter is not None and fixture_filter.player not in (None, player):
+                continue
+            yield "Player {0} predictions".format(player)
+            for prediction in self.iter_predictions(player, fixture_filter):
+                yield str(prediction)
+
+    def iter_results(self, fixture_filter: "FixtureFilter" = None):
+        '''Generate the played fixtures that match the filter'''
+        for row in self.filter_rows(fixture_filter):
+            if self.fixtures[row].is_played() is True:
+                yield self.fixtures[row]
+
+    def iter_predictions(self, player_name: str, fixture_filter: "FixtureFilter" = None, sort: bool = False):
+        '''Generate a player's predictions for the fixtures that match the filter, building each one on demand'''
+
+        if player_name not in self.store.player_index.keys():
+            raise Exception("No player called {0}.".format(player_name))
+
+        rows = self.filter_rows(fixture_filter)
+        if sort is True:
+            # Sort the rows in the same order as Fixture.__lt__ without creating any Predictions
+            rows = sorted(rows, key=lambda row: (self.fixtures[row].group, self.store.when[row],
+                                                 self.fixtures[row].team_a.name))
+
+        points = self.store.player_points(player_name)
+        for row in rows:
+            yield Prediction(self.fixtures[row], self.store.predicted_score(row, player_name), int(points[row]))
+
+    def filter_rows(self, fixture_filter: "FixtureFilter" = None):
+        '''The fixture rows that match the filter in file order'''
+        if fixture_filter is None:
+            return range(self.store.fixture_count)
+        return np.nonzero(fixture_filter.mask(self))[0].tolist()
+
+    @instrumentation.timed("factory.team_history")
+    def team_history(self):
+        '''Prefix sums of the team counters by date, rebuilt at most once for each version of the data'''
+
+        if self._team_history is None or self._team_history[0] != self.version:
+            team_names = list(self.teams.keys())
+            team_index = {team_name: i for i, team_name in enumerate(team_names)}
+            n = self.store.fixture_count
+            history = TeamHistory(team_names,
+                                  [team_index[fixture.team_a.name] for fixture in self.fixtures],
+                                  [team_index[fixture.team_b.name] for fixture in self.fixtures],
+                                  self.store.actual_a[:n], self.store.actual_b[:n],
+                                  self.store.timeline())
+            self._team_history = (self.version, history)
+
+        return self._team_history[1]
+
+    @instrumentation.timed("factory.teams_as_of")
+    def teams_as_of(self, when: datetime.datetime):
+        '''All of the teams with their stats as they were at the end of the specified date'''
+        return self.team_history().teams_as_of(when)
+
+    @instrumentation.timed("factory.scores_as_of")
+    def scores_as_of(self, when: datetime.datetime):
+        '''Each player's total points as they were at the end of the specified date'''
+        timeline = self.store.timeline()
+        i = timeline.index_as_of(when)
+        if i < 0:
+            return {player_name: 0 for player_name in self.store.players}
+        return dict(zip(self.store.players, timeline.cumulative()[i].tolist()))
+
+    @instrumentation.timed("factory.print_player_scores")
+    def print_player_scores(self, as_of: datetime.datetime = None):
+
+        hst = HighScoreTable("World Cup Predictor", max_size=None)
+
+        if as_of is None:
+            totals = self.store.totals()
+            rows = None
+        else:
+            totals = np.array(list(self.scores_as_of(as_of).values()))
+            rows = self.store.when[:self.store.fixture_count] <= as_of.toordinal()
+
+        for col, player in enumerate(self.store.players):
+            hst.add(player, int(totals[col]))
+
+        hst.print()
+
+        print_prediction_details({player: totals[col] for col, player in enumerate(self.store.players)},
+                                 {player: self.store.details(col, rows) for col, player in enumerate(self.store.players)},
+                                 self.scheme.max_points)
+
+    @instrumentation.timed("factory.print_player_score_history")
     def print_player_score_history(self):
-        score_history = {}
+        timeline = self.store.timeline()
+        cumulative = timeline.cumulative()
         print("Date;Player;Score")
-        for player_name in self.predictions.keys():
-            predos = list(self.predictions[player_name])
-            for predo in predos:
-                if predo.is_played() is True:
-                    fixture_date = predo.when
-                    if fixture_date not in score_history.keys():
-                        score_history[fixture_date] = {}
-                    if player_name not in score_history[fixture_date].keys():
-                        score_history[fixture_date][player_name] = 0
-                    score_history[fixture_date][player_name] += predo.points
-
-        running_totals = {}
-        for fixture_date in sorted(list(score_history.keys())):
-            scores = score_history[fixture_date]
-            for player_name in scores.keys():
-                if player_name not in running_totals.keys():
-                    running_totals[player_name] = 0
-                running_totals[player_name] += scores[player_name]
-                print("{0};{1};{2}".format(datetime.datetime.strftime(fixture_date, "%d/%m/%Y"), player_name, running_totals[player_name]))
+        for i, fixture_date in enumerate(timeline.dates):
+            for col in np.nonzero(timeline.daily_predictions[i])[0]:
+                print("{0};{1};{2}".format(datetime.datetime.strftime(fixture_date, "%d/%m/%Y"),
+                                           self.store.players[col], cumulative[i, col]))
 
+    @instrumentation.timed("factory.player_score_history")
     def player_score_history(self):
+        timeline = self.store.timeline()
         score_history = {}
-        for player_name in self.predictions.keys():
-            predos = list(self.predictions[player_name])
-            for predo in predos:
-                if predo.is_played() is True:
-                    fixture_date = predo.when
-                    if player_name not in score_history.keys():
-                        score_history[player_name] = {}
-                    if fixture_date not in score_history[player_name].keys():
-                        score_history[player_name][fixture_date] = 0
-                    score_history[player_name][fixture_date] += predo.points
+        for col, player_name in enumerate(self.store.players):
+            days = np.nonzero(timeline.daily_predictions[:, col])[0]
+            if len(days) > 0:
+                score_history[player_name] = {timeline.dates[i]: int(timeline.daily_points[i, col]) for i in days}
 
         return score_history
 
 
-    def print_groups(self):
+    @instrumentation.timed("factory.print_groups")
+    def print_groups(self, as_of: datetime.datetime = None):
+        all_teams = self.teams if as_of is None else self.teams_as_of(as_of)
+
+        # The results that count towards each group's head-to-head tie breaks
+        group_fixtures = {}
+        for fixture in self.fixtures:
+            if as_of is None or fixture.when <= as_of:
+                group_fixtures.setdefault(fixture.group, []).append(fixture)
+
         print("\nGroups")
         for group in sorted(list(self.groups.keys())):
             team_names = list(self.groups[group])
             teams = []
             for team_name in team_names:
-                teams.append(self.teams[team_name])
+                teams.append(all_teams[team_name])
 
-            teams.sort(reverse=True)
+            teams = rank_teams(teams, group_fixtures.get(group, []))
             print("\nGroup {0}".format(group))
-            row_format = "{0:^25} {1:^3} {2:^3} {3:^3} {4:^3} {5:^3} {6:^3} {7:^3} {8:^3}"
-            print(row_format.format("Team", "P", "W", "D", "L", "F", "A", "GD", "Pts"))
-            for team in teams:
-                print(row_format.format(team.name, team.played, team.won, team.drawn, team.lost,
-                                        team.goals_for, team.goals_against, team.goal_diff, team.points))
+            print_team_table(teams)
         print("\n")
 
-    def print_teams(self):
+    @instrumentation.timed("factory.print_teams")
+    def print_teams(self, as_of: datetime.datetime = None):
+        all_teams = self.teams if as_of is None else self.teams_as_of(as_of)
         print("\nTeams")
-        row_format = "{0:^25} {1:^3} {2:^3} {3:^3} {4:^3} {5:^3} {6:^3} {7:^3} {8:^3}"
-        print(row_format.format("Team", "P", "W", "D", "L", "F", "A", "GD", "Pts"))
-        for team_name in sorted(list(self.teams.keys())):
-            team = self.teams[team_name]
-            print(row_format.format(team.name, team.played, team.won, team.drawn, team.lost,
-                                    team.goals_for, team.goals_against, team.goal_diff, team.points))
+        print_team_table([all_teams[team_name] for team_name in sorted(list(all_teams.keys()))])
         print("\n")
 
 
-from operator import itemgetter
-import pickle
-import logging
-
-
 class HighScoreTable():
+    '''A ranked table of names and scores kept in order with bisect so that adding, updating and
+    ranking a name are all O(log n) searches. Set max_size to None for a table with no size limit.'''
+
     def __init__(self, name="default", max_size=10, prefix=""):
         self.name = name
         self.max_size = max_size
         self.prefix = prefix
-        self.table = []
+
+        # Entries are kept in ascending (score, name) order so the table is the reverse of this list
+        self._entries = []
+        self._scores = []
+        self._by_name = {}
+
+    @property
+    def table(self):
+        return [(name, score) for score, name in reversed(self._entries)]
+
+    @table.setter
+    def table(self, table: list):
+        self._entries = []
+        self._scores = []
+        self._by_name = {}
+        for name, score in table:
+            self._insert(name, score)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, name: str, score: float):
+        i = bisect.bisect_left(self._entries, (score, name))
+        self._entries.insert(i, (score, name))
+        self._scores.insert(i, score)
+        self._by_name[name] = score
+
+    def remove(self, name: str):
+        '''Take a name out of the table, returning True if it was in there'''
+
+        if name not in self._by_name.keys():
+            return False
+
+        score = self._by_name.pop(name)
+        i = bisect.bisect_left(self._entries, (score, name))
+        del self._entries[i]
+        del self._scores[i]
+
+        return True
 
     def add(self, name: str, score: float, auto_save=False):
+        '''Add a name to the table or, if it is already there, move it to its new score'''
 
         added = False
 
+        self.remove(name)
+
         # If the specified score makes it into the high score table...
         if self.is_high_score(score):
-            # Add it and re-sort the table
-            self.table.append((name, score))
-            self.table.sort(key=itemgetter(1, 0), reverse=True)
+            self._insert(name, score)
             added = True
 
         # Trim the size of the table to be the maximum size
-        while len(self.table) > self.max_size:
-            del self.table[-1]
+        while self.max_size is not None and len(self._entries) > self.max_size:
+            score, name = self._entries[0]
+            self.remove(name)
 
         if auto_save is True:
             self.save()
@@ -392,22 +1422,44 @@ class HighScoreTable():
         return added
 
     def is_high_score(self, score):
-        if len(self.table) < self.max_size:
+        if self.max_size is None or len(self._entries) < self.max_size:
             return True
         else:
-            name, lowest_score = self.table[len(self.table) - 1]
+            lowest_score, name = self._entries[0]
             if score > lowest_score:
                 return True
-            elif score == lowest_score and len(self.table) < self.max_size:
-                return True
             else:
                 return False
 
+    def score(self, name: str):
+        return self._by_name.get(name)
+
+    def rank(self, name: str):
+        '''The rank of a name in the table where tied scores share the same rank, or None if it is not there'''
+        if name not in self._by_name.keys():
+            return None
+        return self.rank_of_score(self._by_name[name])
+
+    def rank_of_score(self, score: float):
+        '''The rank that the specified score would have in the table'''
+        return len(self._scores) - bisect.bisect_right(self._scores, score) + 1
+
+    def ranked(self):
+        '''Generate (rank, name, score) for every entry from the top of the table down'''
+        rank = 0
+        previous_score = None
+        for i, (name, score) in enumerate(self.table):
+            if score != previous_score:
+                rank = i + 1
+                previous_score = score
+            yield rank, name, score
+
     def save(self):
         file_name = self.name + ".hst"
-        game_file = open(file_name, "wb")
-        pickle.dump(self, game_file)
-        game_file.close()
+        snapshot.write_snapshot(file_name, {"name": self.name,
+                                            "max_size": self.max_size,
+                                            "prefix": self.prefix,
+                                            "table": self.table})
 
         logging.info("%s saved." % file_name)
 
@@ -416,14 +1468,10 @@ class HighScoreTable():
         file_name = self.name + ".hst"
 
         try:
-            game_file = open(file_name, "rb")
-
-            new_table = pickle.load(game_file)
+            meta, arrays = snapshot.read_snapshot(file_name)
 
-            self.table = new_table.table
-            self.max_size = new_table.max_size
-
-            game_file.close()
+            self.table = [(name, score) for name, score in meta["table"]]
+            self.max_size = meta["max_size"]
 
             logging.info("\n%s loaded.\n" % file_name)
 
@@ -431,15 +1479,127 @@ class HighScoreTable():
 
             logging.warning("High Score Table file %s not found." % file_name)
 
+        except snapshot.SnapshotError as err:
+
+            logging.warning("High Score Table file %s could not be read: %s" % (file_name, str(err)))
+
     def print(self):
-        print("%s High Score Table - top %i scores" % (self.name, self.max_size))
+        if self.max_size is None:
+            print("%s High Score Table - all %i scores" % (self.name, len(self._entries)))
+        else:
+            print("%s High Score Table - top %i scores" % (self.name, self.max_size))
 
-        if len(self.table) == 0:
+        if len(self._entries) == 0:
             print("No high scores recorded.")
         else:
-            for i in range(len(self.table)):
-                name, score = self.table[i]
-                print("%i. %s - %s%s" % (i + 1, name, self.prefix, format(score, ",d")))
+            for rank, name, score in self.ranked():
+                print("%i. %s - %s%s" % (rank, name, self.prefix, format(score, ",d")))
+
+
+class FixtureFilter:
+    '''Criteria for picking out fixtures by player, group, team, date range and whether they have been played'''
+
+    KEYS = ("player", "group", "team", "from", "to", "played", "page")
+
+    def __init__(self, player: str = None, group: str = None, team: str = None,
+                 date_from: datetime.datetime = None, date_to: datetime.datetime = None, played: bool = None):
+        self.player = player
+        self.group = group
+        self.team = team
+        self.date_from = date_from
+        self.date_to = date_to
+        self.played = played
+        self.page_size = None
+
+    @classmethod
+    def parse(cls, args: str):
+        '''Create a filter from comma separated key=value pairs e.g. "team=Arsenal, from=01/09/2018, played=yes".
+        A page=N pair sets the number of lines to show at a time.'''
+
+        fixture_filter = cls()
+
+        for arg in args.split(","):
+            if arg.strip() == "":
+                continue
+            if arg.find("=") < 0:
+                raise Exception("Filter '{0}' should be key=value with a key from {1}.".format(arg.strip(),
+                                                                                         ", ".join(cls.KEYS)))
+            key, value = [part.strip() for part in arg.split("=", 1)]
+            if key == "player":
+                fixture_filter.player = value
+            elif key == "group":
+                fixture_filter.group = value
+            elif key == "team":
+                fixture_filter.team = value
+            elif key == "from":
+                fixture_filter.date_from = datetime.datetime.strptime(value, "%d/%m/%Y")
+            elif key == "to":
+                fixture_filter.date_to = datetime.datetime.strptime(value, "%d/%m/%Y")
+            elif key == "played":
+                fixture_filter.played = value.lower() in ("yes", "y", "true", "1")
+            elif key == "page":
+                fixture_filter.page_size = int(value)
+            else:
+                raise Exception("Unknown filter '{0}'. Use one of {1}.".format(key, ", ".join(cls.KEYS)))
+
+        return fixture_filter
+
+    def mask(self, factory: "FixtureFactory"):
+        '''Boolean mask of the factory's fixture rows that match the filter'''
+
+        store = factory.store
+        n = store.fixture_count
+        mask = np.ones(n, dtype=bool)
+
+        if self.group is not None:
+            mask &= np.array([fixture.group == self.group for fixture in factory.fixtures], dtype=bool)
+        if self.team is not None:
+            mask &= np.array([self.team in (fixture.team_a.name, fixture.team_b.name)
+                              for fixture in factory.fixtures], dtype=bool)
+        if self.date_from is not None:
+            mask &= store.when[:n] >= self.date_from.toordinal()
+        if self.date_to is not None:
+            mask &= store.when[:n] <= self.date_to.toordinal()
+        if self.played is not None:
+            mask &= store.played() == self.played
+
+        return mask
+
+
+def print_team_table(teams: list):
+    row_format = "{0:^25} {1:^3} {2:^3} {3:^3} {4:^3} {5:^3} {6:^3} {7:^3} {8:^3}"
+    print(row_format.format("Team", "P", "W", "D", "L", "F", "A", "GD", "Pts"))
+    for team in teams:
+        print(row_format.format(team.name, team.played, team.won, team.drawn, team.lost,
+                                team.goals_for, team.goals_against, team.goal_diff, team.points))
+
+
+def print_prediction_details(totals: dict, details: dict, max_points: int):
+    '''Print how many points each player scored from each kind of prediction'''
+
+    print("\nPrediction Details:")
+    for player in sorted(totals.keys()):
+        print("Player {0} predictions:".format(player))
+        for point in sorted(list(details[player].keys()), reverse=True):
+            count = details[player][point]
+            print("\tScore {0} x {1} = {2} pts".format(point, count, point * count))
+        matches = sum(list(details[player].values()))
+        average = totals[player] / matches if matches > 0 else 0.0
+        print("\tTotal = {0} pts from {1} matches (Avg={2:.2}, Max points={3})".format(totals[player], matches, average, matches*max_points))
+
+    print("\n")
+
+
+def print_paged(lines, page_size: int = None):
+    '''Print lines a page at a time, asking before each new page. Returns False if the user stopped early.'''
+
+    for i, line in enumerate(lines):
+        if page_size is not None and page_size > 0 and i > 0 and i % page_size == 0:
+            if input("-- More? (Enter to continue, q to quit) --").strip().lower() == "q":
+                return False
+        print(line)
+
+    return True
 
 
 def pick(object_type: str, objects: list, auto_pick: bool = False):
@@ -1,9 +1,32 @@
+import argparse
+import sys
+
 import cli
 
-def main():
 
-    c = cli.WCCLI()
-    c.cmdloop()
+def main(argv: list = None):
+
+    parser = argparse.ArgumentParser(description="World Cup Predictor")
+    parser.add_argument("script", nargs="?", default=None,
+                        help="run the commands in a script file, one per line, and exit ('-' reads standard input)")
+    parser.add_argument("-c", "--command", action="append", default=[],
+                        help="run a command and exit, can be given more than once e.g. -c start -c 'export site'")
+    args = parser.parse_args(argv)
+
+    # Batch mode runs every command to completion in turn rather than in the background
+    if args.script is not None or len(args.command) > 0:
+        c = cli.WCCLI(background=False)
+        lines = list(args.command)
+        if args.script == "-":
+            lines += sys.stdin.read().splitlines()
+        elif args.script is not None:
+            with open(args.script, 'r') as script_file:
+                lines += script_file.read().splitlines()
+        c.run_script(lines)
+    else:
+        c = cli.WCCLI()
+        c.cmdloop()
+
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
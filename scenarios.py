@@ -0,0 +1,287 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import model
+
+
+class OutcomeClasses:
+    '''The different ways a pending fixture can turn out as far as the predictor league is concerned. Every
+    scoreline that gives each player the same points is one class, so a fixture has a handful of classes
+    however many scorelines are possible.'''
+
+    def __init__(self, fixture: model.Fixture, predicted_a, predicted_b, scheme: model.ScoringScheme):
+
+        self.fixture = fixture
+
+        # Scorelines a couple of goals past the biggest prediction behave like every bigger one
+        predicted = (predicted_a >= 0) & (predicted_b >= 0)
+        most_goals = int(max(predicted_a[predicted].max(initial=0), predicted_b[predicted].max(initial=0)))
+        goals = np.arange(most_goals + 3)
+        goals_a, goals_b = [grid.ravel() for grid in np.meshgrid(goals, goals, indexing="ij")]
+
+        shape = (len(goals_a), len(predicted_a))
+        points = scheme.score(goals_a, goals_b, np.broadcast_to(predicted_a, shape), np.broadcast_to(predicted_b, shape))
+        self.points, members = np.unique(points, axis=0, return_inverse=True)
+        members = members.ravel()
+
+        self.labels = [self.label(goals_a[members == c], goals_b[members == c]) for c in range(len(self.points))]
+
+    def __len__(self):
+        return len(self.points)
+
+    def label(self, goals_a, goals_b):
+        '''Describe the scorelines in a class e.g. "2:1" or "any other Arsenal win"'''
+
+        if len(goals_a) == 1:
+            return "{0}:{1}".format(goals_a[0], goals_b[0])
+
+        results = set(np.sign(goals_a - goals_b).tolist())
+        if len(results) > 1:
+            return "any other score"
+
+        result = results.pop()
+        label = "any other draw" if result == 0 else \
+            "any other {0} win".format(self.fixture.team_a.name if result > 0 else self.fixture.team_b.name)
+
+        differences = set(np.abs(goals_a - goals_b).tolist())
+        if result != 0 and len(differences) == 1:
+            label += " by {0}".format(differences.pop())
+
+        return label
+
+
+class ScenarioResult:
+    '''Where each player stands whatever happens in the pending fixtures'''
+
+    CLINCHED = "clinched"
+    ELIMINATED = "eliminated"
+    ALIVE = "alive"
+    UNDECIDED = "undecided"
+
+    def __init__(self, player_names: list, totals, fixtures: list, combinations: int, statuses: dict, needs: dict,
+                 overtake):
+        self.player_names = player_names
+        self.totals = totals
+        self.fixtures = fixtures
+        self.combinations = combinations
+        self.statuses = statuses
+        self.needs = needs
+        self.overtake = overtake
+
+    def can_overtake(self, player_name: str, rival_name: str):
+        '''Whether some set of results would put the player strictly above the rival'''
+        return bool(self.overtake[self.player_names.index(player_name), self.player_names.index(rival_name)])
+
+    def print(self):
+
+        print("\n{0} pending fixtures that matter, {1:,} combinations of outcomes".format(len(self.fixtures),
+                                                                                       self.combinations))
+
+        order = sorted(range(len(self.player_names)), key=lambda i: (-self.totals[i], self.player_names[i]))
+        for i in order:
+            player_name = self.player_names[i]
+            status = self.statuses[player_name]
+            print("\n{0} ({1} pts): {2}".format(player_name, self.totals[i], {
+                ScenarioResult.CLINCHED: "has clinched at least a share of first place",
+                ScenarioResult.ELIMINATED: "can no longer finish first",
+                ScenarioResult.ALIVE: "can still finish first",
+                ScenarioResult.UNDECIDED: "too many combinations to say"}[status]))
+
+            for fixture, outcomes in self.needs.get(player_name, {}).items():
+                print("\tneeds {0} v {1} to be {2}".format(fixture.team_a.name, fixture.team_b.name,
+                                                          " or ".join(outcomes)))
+
+            rivals = [self.player_names[j] for j in order if j != i and self.totals[j] >= self.totals[i] and self.overtake[i, j]]
+            if len(rivals) > 0:
+                print("\tcan still overtake {0}".format(", ".join(rivals)))
+
+        print("\n")
+
+
+class ScenarioEvaluator:
+    '''Works out which outcomes of the pending fixtures would let each player finish first, scoring every
+    player's existing predictions with the factory's scoring scheme. Rather than trying every combination
+    of outcomes, overtaking and clinching are settled exactly one pair of players at a time and whether a
+    player can still win outright is a depth first search that drops outcomes that can never be better for
+    them and abandons any branch where a rival can no longer be caught.'''
+
+    def __init__(self, factory: model.FixtureFactory, max_nodes: int = 1000000):
+
+        self.max_nodes = max_nodes
+        self.player_names = list(factory.store.players)
+        self.totals = factory.store.totals().astype(np.int32)
+
+        # Only fixtures where the outcome can change someone's points matter
+        self.fixtures = []
+        self.classes = []
+        for row, fixture in enumerate(factory.fixtures):
+            if fixture.is_played() is False:
+                classes = OutcomeClasses(fixture, factory.store.predicted_a[row], factory.store.predicted_b[row],
+                                         factory.scheme)
+                if len(classes) > 1:
+                    self.fixtures.append(fixture)
+                    self.classes.append(classes)
+
+        # Best and worst case points difference between every pair of players over the pending fixtures
+        players = len(self.player_names)
+        self.most_ahead = self.totals[:, np.newaxis] - self.totals[np.newaxis, :]
+        self.least_ahead = self.most_ahead.copy()
+        for classes in self.classes:
+            points = classes.points.astype(np.int32)
+            differences = points[:, :, np.newaxis] - points[:, np.newaxis, :]
+            self.most_ahead = self.most_ahead + differences.max(axis=0)
+            self.least_ahead = self.least_ahead + differences.min(axis=0)
+
+        self.combinations = math.prod(len(classes) for classes in self.classes)
+
+    def run(self, workers: int = None):
+        '''Evaluate every player, spreading the players over a pool of processes'''
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        players = list(range(len(self.player_names)))
+        if workers > 1 and len(players) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.evaluate_player, players))
+        else:
+            results = [self.evaluate_player(player) for player in players]
+
+        statuses = {}
+        needs = {}
+        for player, (status, player_needs) in zip(players, results):
+            statuses[self.player_names[player]] = status
+            if len(player_needs) > 0:
+                needs[self.player_names[player]] = {self.fixtures[f]: [self.classes[f].labels[c] for c in allowed]
+                                                    for f, allowed in player_needs.items()}
+
+        return ScenarioResult(self.player_names, self.totals, self.fixtures, self.combinations, statuses, needs,
+                              self.most_ahead > 0)
+
+    def evaluate_player(self, player: int):
+        '''The player's status and, while they can still finish first, the outcomes they need in each fixture
+        that is decisive for them'''
+
+        if np.all(self.least_ahead[player] >= 0):
+            return ScenarioResult.CLINCHED, {}
+        if np.any(self.most_ahead[player] < 0):
+            return ScenarioResult.ELIMINATED, {}
+
+        # Rivals that can't finish above the player whatever happens can be left out of the search
+        rivals = np.nonzero(self.least_ahead[player] < 0)[0]
+        differences = [(classes.points[:, [player]].astype(np.int32) - classes.points[:, rivals]) for classes in self.classes]
+        start = self.totals[player] - self.totals[rivals]
+
+        search = Search(differences, self.max_nodes)
+        scenario = search.find(start)
+        if scenario is None:
+            return (ScenarioResult.UNDECIDED if search.exhausted is True else ScenarioResult.ELIMINATED), {}
+
+        # Find which outcomes of each fixture still leave a way to finish first. Every winning scenario
+        # found along the way shows that its own outcomes, and any outcome that could be swapped into it
+        # without a rival going ahead, are possible without searching for them again.
+        possible = [set() for classes in self.classes]
+        self._add_possible(possible, differences, start, scenario)
+
+        for f, classes in enumerate(self.classes):
+            for c in range(len(classes)):
+                if c in possible[f]:
+                    continue
+                scenario = search.find(start, fixed=(f, c))
+                if scenario is not None:
+                    self._add_possible(possible, differences, start, scenario)
+                elif search.exhausted is True:
+                    return ScenarioResult.UNDECIDED, {}
+
+        needs = {f: sorted(possible[f]) for f, classes in enumerate(self.classes) if len(possible[f]) < len(classes)}
+        return ScenarioResult.ALIVE, needs
+
+    @staticmethod
+    def _add_possible(possible: list, differences: list, start, scenario: list):
+
+        ahead = start + sum(d[c] for d, c in zip(differences, scenario))
+        for f, (d, c) in enumerate(zip(differences, scenario)):
+            possible[f].update(np.nonzero(np.all(ahead - d[c] + d >= 0, axis=1))[0].tolist())
+
+
+class Search:
+    '''Depth first search for one outcome per fixture that leaves a player level with or ahead of every rival,
+    given each fixture's points differences indexed by [outcome, rival]'''
+
+    def __init__(self, differences: list, max_nodes: int):
+
+        self.differences = differences
+        self.max_nodes = max_nodes
+        self.exhausted = False
+        rivals = differences[0].shape[1] if len(differences) > 0 else 0
+
+        # Decide the fixtures with the biggest swings first so that hopeless branches are found early
+        swing = [int((d.max(axis=0) - d.min(axis=0)).max(initial=0)) for d in differences]
+        self.order = sorted(range(len(differences)), key=lambda f: -swing[f])
+
+        # Best and worst case differences over the fixtures still to be decided at each depth
+        self.best_rest = np.zeros((len(differences) + 1, rivals), dtype=np.int32)
+        self.worst_rest = np.zeros((len(differences) + 1, rivals), dtype=np.int32)
+        for depth in range(len(self.order) - 1, -1, -1):
+            d = differences[self.order[depth]]
+            self.best_rest[depth] = self.best_rest[depth + 1] + d.max(axis=0)
+            self.worst_rest[depth] = self.worst_rest[depth + 1] + d.min(axis=0)
+
+        # An outcome that is never better for the player against any rival than another one can be skipped
+        self.candidates = [self.undominated(differences[f]) for f in self.order]
+
+    @staticmethod
+    def undominated(d):
+        '''Outcomes not dominated by another, best first. Of outcomes with identical differences only one is kept.'''
+        keep = []
+        for c in np.argsort(-d.sum(axis=1), kind="stable"):
+            if not any(np.all(d[k] >= d[c]) for k in keep):
+                keep.append(int(c))
+        return keep
+
+    def find(self, start, fixed: tuple = None):
+        '''A list of outcomes, one per fixture, or None if there isn't one. Optionally with one fixture's outcome
+        fixed. Sets exhausted if the search gave up before finding out.'''
+
+        self.nodes = 0
+        self.exhausted = False
+        self.fixed = fixed
+        chosen = [None] * len(self.differences)
+
+        if self._search(0, np.asarray(start, dtype=np.int32), chosen) is False:
+            return None
+
+        # Fixtures the search didn't need to decide can be anything, so take the fixed or best outcome
+        if fixed is not None and chosen[fixed[0]] is None:
+            chosen[fixed[0]] = fixed[1]
+        return [c if c is not None else self.undominated(self.differences[f])[0] for f, c in enumerate(chosen)]
+
+    def _search(self, depth: int, ahead, chosen: list):
+
+        # Prune when a rival can't be caught, stop when no rival can catch up
+        if np.any(ahead + self.best_rest[depth] < 0):
+            return False
+        if np.all(ahead + self.worst_rest[depth] >= 0):
+            return True
+        if depth == len(self.order):
+            return bool(np.all(ahead >= 0))
+
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            self.exhausted = True
+            return False
+
+        f = self.order[depth]
+        outcomes = [self.fixed[1]] if self.fixed is not None and self.fixed[0] == f else self.candidates[depth]
+        for c in outcomes:
+            chosen[f] = c
+            if self._search(depth + 1, ahead + self.differences[f][c], chosen) is True:
+                return True
+            if self.exhausted is True:
+                break
+        chosen[f] = None
+
+        return False
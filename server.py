@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import threading
+import urllib.parse
+
+import export
+import model
+
+
+class CachedResponse:
+    '''A JSON response body built for one version of the data'''
+
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.body = body
+        self.etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+
+
+class LeaderboardServer:
+    '''Local asyncio HTTP server publishing a FixtureFactory's standings, scores, history and predictions as JSON.
+    Each response is built at most once per data version and carries an ETag so that polling clients
+    with an unchanged copy get a cheap 304 Not Modified.'''
+
+    def __init__(self, factory: model.FixtureFactory, host: str = "127.0.0.1", port: int = 8080):
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.exporter = export.Exporter(factory)
+        self.cache = {}
+        self.requests = 0
+        self.loop = None
+        self.server = None
+        self.error = None
+        self.connections = {}
+        self._thread = None
+
+    def resources(self):
+        return {"/standings": self.exporter.standings,
+                "/teams": self.exporter.teams,
+                "/scores": self.exporter.scores,
+                "/score_details": self.exporter.score_details,
+                "/history": self.exporter.history,
+                "/predictions": self.predictions}
+
+    def predictions(self, player_name: str = None):
+        if player_name is None:
+            return {"players": self.factory.store.players}
+        return {"player": player_name,
+                "columns": ["group", "team_a", "team_b", "date", "prediction", "points"],
+                "rows": [[predo.group, predo.team_a.name, predo.team_b.name, predo.when.strftime("%Y-%m-%d"),
+                          str(predo.score), predo.points]
+                         for predo in self.factory.iter_predictions(player_name)]}
+
+    def response(self, path: str):
+        '''The cached response for a path, building it if the data has changed since it was last built'''
+
+        cached = self.cache.get(path)
+        if cached is not None and cached.version == self.factory.version:
+            return cached
+
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        resource = self.resources().get("/" + parts[0])
+        if resource is None or len(parts) > 2 or (len(parts) == 2 and parts[0] != "predictions"):
+            return None
+
+        with self.factory.lock:
+            version = self.factory.version
+            data = resource(*parts[1:])
+
+        cached = CachedResponse(version, json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        self.cache[path] = cached
+
+        return cached
+
+    def handle_request(self, method: str, target: str, headers: dict):
+        '''Work out the status, body and extra headers for a request'''
+
+        path = urllib.parse.urlsplit(target).path.rstrip("/") or "/"
+
+        if method not in ("GET", "HEAD"):
+            return 405, b'{"error":"method not allowed"}', {"Allow": "GET, HEAD"}
+
+        if path == "/":
+            return 200, json.dumps({"resources": sorted(self.resources().keys()),
+                                    "version": self.factory.version}).encode("utf-8"), {}
+
+        try:
+            cached = self.response(path)
+        except Exception as err:
+            return 404, json.dumps({"error": str(err)}).encode("utf-8"), {}
+
+        if cached is None:
+            return 404, b'{"error":"not found"}', {}
+
+        extra = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if headers.get("if-none-match") == cached.etag:
+            return 304, b"", extra
+
+        return 200, cached.body, extra
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        # Keep hold of the open connections so that stopping can close any a client is keeping alive
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if request_line.strip() == b"":
+                    break
+
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line.strip() == b"":
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                self.requests += 1
+                status, body, extra = self.handle_request(method, target, headers)
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                head = ["HTTP/1.1 {0} {1}".format(status, STATUS_TEXT.get(status, "")),
+                        "Content-Type: application/json",
+                        "Content-Length: {0}".format(len(body)),
+                        "Connection: {0}".format("keep-alive" if keep_alive else "close")]
+                head += ["{0}: {1}".format(name, value) for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+
+                if keep_alive is False:
+                    break
+
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Stopping the server cancels the handlers, which is just another way for the connection to end
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def serve(self, started: threading.Event = None):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start(self):
+        '''Run the server on its own event loop in a background thread'''
+
+        started = threading.Event()
+
+        def run():
+            self.error = None
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(self.serve(started))
+            except asyncio.CancelledError:
+                pass
+            except Exception as err:
+                self.error = err
+            finally:
+                self.loop.close()
+                started.set()
+
+        self._thread = threading.Thread(target=run, name="LeaderboardServer", daemon=True)
+        self._thread.start()
+        started.wait()
+        if self.error is not None:
+            raise self.error
+
+    async def shutdown(self):
+        '''Close the open connections and wait for their handlers to finish, then stop listening'''
+
+        tasks = list(self.connections.keys())
+        for writer in self.connections.values():
+            writer.close()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Closing the server ends serve, and with it the loop, so nothing can be awaited after it
+        self.server.close()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_closed() is False and self.server is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+STATUS_TEXT = {200: "OK", 304: "Not Modified", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+def main(argv: list = None):
+
+    parser = argparse.ArgumentParser(description="Serve the leaderboards as JSON over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--file", default=None, help="fixtures file to load")
+    args = parser.parse_args(argv)
+
+    factory = model.FixtureFactory()
+    factory.load(args.file)
+
+    server = LeaderboardServer(factory, args.host, args.port)
+    print("Serving on http://{0}:{1}/".format(args.host, args.port))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
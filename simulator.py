@@ -0,0 +1,209 @@
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import model
+
+
+class StrengthModel:
+    '''Poisson model of each team's attack and defence strengths fitted from their goals so far'''
+
+    def __init__(self, factory: model.FixtureFactory):
+
+        self.team_names = list(factory.teams.keys())
+        self.team_index = {team_name: i for i, team_name in enumerate(self.team_names)}
+
+        teams = [factory.teams[team_name] for team_name in self.team_names]
+        played = np.array([team.played for team in teams], dtype=float)
+        goals_for = np.array([team.goals_for for team in teams], dtype=float)
+        goals_against = np.array([team.goals_against for team in teams], dtype=float)
+
+        # Average goals scored by the home (team A) and away (team B) sides in the fixtures played so far
+        results = [fixture.score for fixture in factory.fixtures if fixture.is_played() is True]
+        if len(results) > 0:
+            self.home_goals = max(0.1, float(np.mean([score.score_a for score in results])))
+            self.away_goals = max(0.1, float(np.mean([score.score_b for score in results])))
+        else:
+            self.home_goals = self.away_goals = 1.0
+        average = (self.home_goals + self.away_goals) / 2
+
+        # Strength relative to an average team, with teams that have not played yet treated as average
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.attack = np.where(played > 0, goals_for / (played * average), 1.0)
+            self.defence = np.where(played > 0, goals_against / (played * average), 1.0)
+
+        # A team that has not scored (or conceded) yet still has some chance to
+        self.attack = np.maximum(self.attack, 0.05)
+        self.defence = np.maximum(self.defence, 0.05)
+
+    def expected_goals(self, team_a_name: str, team_b_name: str):
+        a = self.team_index[team_a_name]
+        b = self.team_index[team_b_name]
+        return (self.home_goals * self.attack[a] * self.defence[b],
+                self.away_goals * self.attack[b] * self.defence[a])
+
+
+class SimulationResult:
+    '''Finishing position counts for teams and win counts for predictor players over a number of simulations'''
+
+    def __init__(self, team_names: list, group_of: dict, player_names: list, simulations: int,
+                 positions, player_wins):
+        self.team_names = team_names
+        self.group_of = group_of
+        self.player_names = player_names
+        self.simulations = simulations
+        self.positions = positions
+        self.player_wins = player_wins
+
+    def position_probabilities(self, team_name: str):
+        '''Probability of the team finishing in each position of its group, top first'''
+        return self.positions[self.team_names.index(team_name)] / self.simulations
+
+    def win_probabilities(self):
+        return {player_name: float(self.player_wins[i] / self.simulations) for i, player_name in enumerate(self.player_names)}
+
+    def print(self, relegation_places: int = 0):
+
+        print("\nSimulated {0:,} outcomes of the remaining fixtures".format(self.simulations))
+
+        for group in sorted(set(self.group_of.values())):
+            team_ids = [i for i, team_name in enumerate(self.team_names) if self.group_of[team_name] == group]
+            group_size = len(team_ids)
+
+            # List the teams in order of their expected finishing position
+            expected = {i: np.dot(np.arange(1, group_size + 1), self.positions[i, :group_size]) / self.simulations
+                        for i in team_ids}
+            team_ids.sort(key=lambda i: expected[i])
+
+            print("\nGroup {0}".format(group))
+            row_format = "{0:^25} {1:^7} {2:^7} {3:^7}"
+            print(row_format.format("Team", "Avg Pos", "1st %", "Bottom %"))
+            for i in team_ids:
+                top = self.positions[i, 0] / self.simulations
+                bottom = self.positions[i, group_size - relegation_places:group_size].sum() / self.simulations
+                print(row_format.format(self.team_names[i], "{0:.1f}".format(expected[i]),
+                                        "{0:.1%}".format(top),
+                                        "{0:.1%}".format(bottom) if relegation_places > 0 else "-"))
+
+        print("\nPredictor League")
+        for player_name, chance in sorted(self.win_probabilities().items(), key=lambda item: item[1], reverse=True):
+            print("\t{0}: {1:.1%} chance of winning".format(player_name, chance))
+
+        print("\n")
+
+
+class SeasonSimulator:
+    '''Monte Carlo simulation of the unplayed fixtures, scored as both a league table and a predictor league'''
+
+    def __init__(self, factory: model.FixtureFactory, strengths: StrengthModel = None):
+
+        self.strengths = strengths if strengths is not None else StrengthModel(factory)
+        self.team_names = self.strengths.team_names
+        self.player_names = list(factory.store.players)
+        self.scheme = factory.scheme
+
+        # Knockout rounds have group codes of their own, so a team's group is the one it plays most often in
+        appearances = collections.Counter(itertools.chain.from_iterable(
+            ((fixture.group, fixture.team_a.name), (fixture.group, fixture.team_b.name)) for fixture in factory.fixtures))
+        self.group_of = {}
+        for (group, team_name), count in appearances.most_common():
+            self.group_of.setdefault(team_name, group)
+        self.group_ids = [sorted(set(self.group_of.values())).index(self.group_of[team_name])
+                          for team_name in self.team_names]
+
+        # Where each team stands now...
+        teams = [factory.teams[team_name] for team_name in self.team_names]
+        self.points = np.array([team.points for team in teams], dtype=np.int32)
+        self.goal_diff = np.array([team.goal_diff for team in teams], dtype=np.int32)
+        self.goals_for = np.array([team.goals_for for team in teams], dtype=np.int32)
+        self.player_points = factory.store.totals().astype(np.int32)
+
+        # ...and what is left to play
+        remaining = [row for row, fixture in enumerate(factory.fixtures) if fixture.is_played() is False]
+        self.team_a = np.array([self.strengths.team_index[factory.fixtures[row].team_a.name] for row in remaining],
+                               dtype=np.int32)
+        self.team_b = np.array([self.strengths.team_index[factory.fixtures[row].team_b.name] for row in remaining],
+                               dtype=np.int32)
+        expected = [self.strengths.expected_goals(factory.fixtures[row].team_a.name, factory.fixtures[row].team_b.name)
+                    for row in remaining]
+        self.expected_a = np.array([goals[0] for goals in expected], dtype=float)
+        self.expected_b = np.array([goals[1] for goals in expected], dtype=float)
+        self.predicted_a = np.array(factory.store.predicted_a[remaining], dtype=np.int16)
+        self.predicted_b = np.array(factory.store.predicted_b[remaining], dtype=np.int16)
+
+    def run(self, simulations: int = 10000, workers: int = None, batch_size: int = 2000, seed: int = None):
+        '''Run the simulations in batches spread over a pool of processes'''
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        batches = [batch_size] * (simulations // batch_size)
+        if simulations % batch_size > 0:
+            batches.append(simulations % batch_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(batches))
+
+        positions = np.zeros((len(self.team_names), len(self.team_names)), dtype=np.int64)
+        player_wins = np.zeros(len(self.player_names), dtype=float)
+
+        if workers > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.simulate_batch, batches, seeds))
+        else:
+            results = [self.simulate_batch(size, batch_seed) for size, batch_seed in zip(batches, seeds)]
+
+        for batch_positions, batch_wins in results:
+            positions += batch_positions
+            player_wins += batch_wins
+
+        return SimulationResult(self.team_names, self.group_of, self.player_names, simulations,
+                                positions, player_wins)
+
+    def simulate_batch(self, simulations: int, seed):
+        '''Simulate a batch of outcomes and count finishing positions and predictor league winners'''
+
+        rng = np.random.default_rng(seed)
+        teams = len(self.team_names)
+        fixtures = len(self.team_a)
+
+        goals_a = rng.poisson(self.expected_a, size=(simulations, fixtures)).astype(np.int16)
+        goals_b = rng.poisson(self.expected_b, size=(simulations, fixtures)).astype(np.int16)
+
+        # Add each simulated result onto the two teams' current stats
+        home = np.zeros((fixtures, teams), dtype=np.int32)
+        home[np.arange(fixtures), self.team_a] = 1
+        away = np.zeros((fixtures, teams), dtype=np.int32)
+        away[np.arange(fixtures), self.team_b] = 1
+
+        points_a = np.where(goals_a > goals_b, 3, np.where(goals_a == goals_b, 1, 0)).astype(np.int32)
+        points_b = np.where(goals_b > goals_a, 3, np.where(goals_a == goals_b, 1, 0)).astype(np.int32)
+        difference = (goals_a - goals_b).astype(np.int32)
+
+        points = self.points + points_a @ home + points_b @ away
+        goal_diff = self.goal_diff + difference @ home - difference @ away
+        goals_for = self.goals_for + goals_a.astype(np.int32) @ home + goals_b.astype(np.int32) @ away
+
+        # Rank every team within its group by points, goal difference then goals scored
+        sort_key = (points.astype(np.int64) * 1000000 + (goal_diff.astype(np.int64) + 1000) * 1000 + goals_for)
+        positions = np.zeros((teams, teams), dtype=np.int64)
+        group_ids = np.array(self.group_ids)
+        for group in np.unique(group_ids):
+            members = np.nonzero(group_ids == group)[0]
+            order = np.argsort(-sort_key[:, members], axis=1, kind="stable")
+            ranks = np.argsort(order, axis=1)
+            for j, team in enumerate(members):
+                positions[team] += np.bincount(ranks[:, j], minlength=teams)
+
+        # Score every player's predictions against every simulated set of results
+        player_wins = np.zeros(len(self.player_names), dtype=float)
+        if len(self.player_names) > 0:
+            scored = self.scheme.score(goals_a, goals_b, self.predicted_a[np.newaxis], self.predicted_b[np.newaxis])
+            totals = self.player_points + scored.sum(axis=1, dtype=np.int32)
+            winners = totals == totals.max(axis=1, keepdims=True)
+
+            # Tied winners share the win
+            player_wins = (winners / winners.sum(axis=1, keepdims=True)).sum(axis=0)
+
+        return positions, player_wins
@@ -0,0 +1,122 @@
+'''
+Versioned binary snapshot files.
+
+A snapshot is a small JSON header followed by raw NumPy arrays. Reading one memory-maps the
+arrays straight back in, so there is no pickling and no CSV parsing involved.
+
+    8 bytes   magic b"WCPSNAP\\0"
+    4 bytes   format version (little endian unsigned int)
+    4 bytes   length of the JSON header in bytes
+    n bytes   JSON header {"meta": {...}, "arrays": {name: {"dtype", "shape", "offset"}}}
+    ...       array data, each array starting on an 8 byte boundary
+'''
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"WCPSNAP\0"
+VERSION = 1
+ALIGN = 8
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _aligned(offset: int):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_snapshot(filename: str, meta: dict, arrays: dict = None):
+    '''Write a dictionary of JSON friendly metadata and a dictionary of NumPy arrays to a snapshot file'''
+
+    if arrays is None:
+        arrays = {}
+
+    descriptors = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        descriptors[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+
+    header = json.dumps({"meta": meta, "arrays": descriptors}).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    # Write to a temporary file and swap it in so that readers never see half a snapshot
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as snapshot_file:
+        snapshot_file.write(MAGIC)
+        snapshot_file.write(struct.pack("<II", VERSION, len(header)))
+        snapshot_file.write(header)
+        for name, array in arrays.items():
+            snapshot_file.seek(data_start + descriptors[name]["offset"])
+            snapshot_file.write(array.tobytes())
+        snapshot_file.truncate(data_start + offset)
+
+    os.replace(temp_filename, filename)
+
+
+def read_snapshot(filename: str, mmap_mode: str = "c"):
+    '''Read a snapshot file and return its metadata and a dictionary of memory-mapped arrays.
+    The default copy-on-write mode lets the arrays be changed in memory without touching the file.'''
+
+    with open(filename, "rb") as snapshot_file:
+        if snapshot_file.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError("%s is not a snapshot file." % filename)
+
+        version, header_length = struct.unpack("<II", snapshot_file.read(8))
+        if version != VERSION:
+            raise SnapshotError("%s is snapshot version %i, expected %i." % (filename, version, VERSION))
+
+        try:
+            header = json.loads(snapshot_file.read(header_length).decode("utf-8"))
+        except ValueError as err:
+            raise SnapshotError("%s has a corrupt header: %s" % (filename, str(err)))
+
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+
+    arrays = {}
+    for name, descriptor in header["arrays"].items():
+        shape = tuple(descriptor["shape"])
+        dtype = np.dtype(descriptor["dtype"])
+        if int(np.prod(shape)) == 0:
+            # Empty arrays can't be memory-mapped
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(filename, dtype=dtype, mode=mmap_mode, shape=shape,
+                                     offset=data_start + descriptor["offset"])
+
+    return header["meta"], arrays
+
+
+def file_hash(filename: str):
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def file_key(filename: str, with_hash: bool = True):
+    '''The modified time, size and optionally the content hash that identify a version of a file'''
+    stat = os.stat(filename)
+    key = {"mtime": stat.st_mtime, "size": stat.st_size}
+    if with_hash is True:
+        key["sha256"] = file_hash(filename)
+    return key
+
+
+def is_current(key: dict, filename: str):
+    '''Is the key still a match for the file? An unchanged mtime and size is trusted without hashing.'''
+    if key is None or os.path.exists(filename) is False:
+        return False
+    current = file_key(filename, with_hash=False)
+    if current["mtime"] == key.get("mtime") and current["size"] == key.get("size"):
+        return True
+    return current["size"] == key.get("size") and file_hash(filename) == key.get("sha256")
@@ -0,0 +1,128 @@
+import csv
+import datetime
+import os
+import re
+
+import numpy as np
+
+import model
+
+
+class Submission:
+    '''One player's predicted score for a fixture and when it was submitted'''
+
+    __slots__ = ("player", "team_a", "team_b", "score", "submitted")
+
+    def __init__(self, player: str, team_a: str, team_b: str, score: str, submitted: datetime.datetime = None):
+        self.player = player
+        self.team_a = team_a
+        self.team_b = team_b
+        self.score = score
+        self.submitted = submitted if submitted is not None else datetime.datetime.now()
+
+    def __str__(self):
+        return "{0}: {1} {3} {2}".format(self.player, self.team_a, self.team_b, self.score)
+
+
+class SubmissionResult:
+
+    def __init__(self):
+        self.accepted = []
+        self.rejected = []
+
+    def reject(self, submission: Submission, reason: str):
+        self.rejected.append((submission, reason))
+
+    def print(self):
+        print("\n{0} predictions accepted, {1} rejected.".format(len(self.accepted), len(self.rejected)))
+        for submission, reason in self.rejected:
+            print("\t{0} - {1}".format(submission, reason))
+
+
+class PredictionIngester:
+    '''Checks batches of predictions from any number of players and adds the valid ones to a FixtureFactory
+    straight away, re-scoring only the fixtures they are for. Accepted predictions are appended to the
+    factory's submissions file so that they are applied again whenever the fixtures are reloaded.'''
+
+    SCORE_FORMAT = re.compile(r"(\d{1,2}):(\d{1,2})")
+    COLUMNS = ["Player", "TeamA", "TeamB", "Score", "Submitted"]
+
+    def __init__(self, factory: model.FixtureFactory, log: bool = True):
+        self.factory = factory
+        self.log = log
+
+    def validate(self, submissions: list):
+        '''Split a batch into the valid predictions, as parallel lists of submissions, fixture rows and goals,
+        and a SubmissionResult holding the rejected ones'''
+
+        result = SubmissionResult()
+        valid, rows, goals, submitted = [], [], [], []
+
+        for submission in submissions:
+            match = PredictionIngester.SCORE_FORMAT.fullmatch(str(submission.score).strip())
+            key = (submission.team_a, submission.team_b)
+            row = self.factory.fixture_index.get(key)
+            if submission.player is None or submission.player.strip() == "":
+                result.reject(submission, "no player name")
+            elif match is None:
+                result.reject(submission, "score must be in the format hh:mm")
+            elif key not in self.factory.fixture_index.keys():
+                result.reject(submission, "no fixture found for {0} v {1}".format(submission.team_a, submission.team_b))
+            elif row is None:
+                result.reject(submission, "more than one {0} v {1} fixture".format(submission.team_a, submission.team_b))
+            else:
+                valid.append(submission)
+                rows.append(row)
+                goals.append((int(match.group(1)), int(match.group(2))))
+                submitted.append(submission.submitted.toordinal())
+
+        # Predictions have to be in before the day of the fixture
+        rows = np.array(rows, dtype=np.intp)
+        in_time = np.array(submitted, dtype=np.int32) < self.factory.store.when[rows]
+        for i in np.nonzero(~in_time)[0]:
+            result.reject(valid[i], "submitted after the deadline of {0}".format(
+                datetime.datetime.strftime(self.factory.fixtures[rows[i]].when, "%d/%m/%Y")))
+
+        accepted = np.nonzero(in_time)[0]
+        goals = np.array(goals, dtype=np.int8).reshape((-1, 2))
+        return [valid[i] for i in accepted], rows[accepted], goals[accepted], result
+
+    def submit(self, submissions: list):
+        '''Validate a batch of submissions and apply the ones that pass. Where a player submits more than one
+        prediction for the same fixture the last one wins.'''
+
+        with self.factory.lock:
+            accepted, rows, goals, result = self.validate(submissions)
+
+            if len(accepted) > 0:
+                self.factory.apply_predictions([submission.player for submission in accepted], rows,
+                                               goals[:, 0], goals[:, 1])
+                if self.log is True:
+                    self.write_log(accepted)
+
+        result.accepted = accepted
+        return result
+
+    def write_log(self, accepted: list):
+
+        filename = self.factory.submissions_filename
+        is_new = os.path.exists(filename) is False
+        with open(filename, 'a', newline='') as object_file:
+            writer = csv.writer(object_file)
+            if is_new is True:
+                writer.writerow(PredictionIngester.COLUMNS)
+            writer.writerows([[submission.player, submission.team_a, submission.team_b, submission.score,
+                               submission.submitted.isoformat(timespec="seconds")] for submission in accepted])
+
+    @staticmethod
+    def read_csv(filename: str):
+        '''Read a batch of submissions from a file with Player, TeamA, TeamB, Score and optional Submitted columns'''
+
+        submissions = []
+        with open(filename, 'r') as object_file:
+            for row in csv.DictReader(object_file):
+                submitted = row.get("Submitted")
+                submissions.append(Submission(row.get("Player"), row.get("TeamA"), row.get("TeamB"), row.get("Score"),
+                                              datetime.datetime.fromisoformat(submitted) if submitted else None))
+
+        return submissions
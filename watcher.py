@@ -0,0 +1,126 @@
+import csv
+import logging
+import os
+import threading
+
+import model
+
+
+class WatchedFile:
+    '''The last seen contents of a fixtures file and the FixtureFactory that it was loaded into'''
+
+    IDENTITY = ("Group", "TeamA", "TeamB", "When")
+
+    def __init__(self, filename: str, factory: model.FixtureFactory):
+        self.filename = filename
+        self.factory = factory
+        self.stamp = None
+        self.lines = []
+        self.refresh()
+
+    def refresh(self):
+        stat = os.stat(self.filename)
+        self.stamp = (stat.st_mtime, stat.st_size)
+        with open(self.filename, 'r') as object_file:
+            self.lines = [line for line in object_file.read().splitlines() if line.strip() != ""]
+
+    def is_changed(self):
+        stat = os.stat(self.filename)
+        return (stat.st_mtime, stat.st_size) != self.stamp
+
+    @staticmethod
+    def parse(line: str, header: list):
+        return dict(zip(header, next(csv.reader([line]))))
+
+    def apply_changes(self):
+        '''Parse just the rows that have changed since the last look and apply them to the factory'''
+
+        old_lines = self.lines
+        self.refresh()
+        new_lines = self.lines
+
+        if len(new_lines) < len(old_lines) or len(new_lines) == 0:
+            # Rows have been deleted so the fixture order can't be trusted
+            self.factory.reload()
+            return len(new_lines)
+
+        old_header = next(csv.reader([old_lines[0]]))
+        header = next(csv.reader([new_lines[0]]))
+        header_changed = old_header != header
+
+        changes = 0
+
+        # Edited rows...
+        for i in range(1, len(old_lines)):
+            if header_changed is False and new_lines[i] == old_lines[i]:
+                continue
+
+            old_row = self.parse(old_lines[i], old_header)
+            row = self.parse(new_lines[i], header)
+
+            if [old_row.get(key) for key in WatchedFile.IDENTITY] != [row.get(key) for key in WatchedFile.IDENTITY]:
+                # The fixture itself has been changed rather than its result or predictions
+                self.factory.reload()
+                return len(new_lines)
+
+            # Line i is the fixture at row i - 1, which also picks the right one when two teams meet twice
+            if old_row.get("Score") != row.get("Score"):
+                self.factory.update_result_row(i - 1, row.get("Score"))
+            if header_changed is True or [old_row.get(key) for key in old_header[5:]] != [row.get(key) for key in header[5:]]:
+                self.factory.update_predictions_row(i - 1, row, header)
+            changes += 1
+
+        # ...and appended rows
+        for i in range(len(old_lines), len(new_lines)):
+            self.factory.append_fixture(self.parse(new_lines[i], header), header)
+            changes += 1
+
+        return changes
+
+
+class FixtureWatcher:
+    '''Polls fixture files for appended and edited rows and pushes just those rows into their FixtureFactory.
+    Subscribe to the factory to be told about each change.'''
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.files = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, factory: model.FixtureFactory, filename: str = None):
+        if filename is None:
+            filename = factory.filename
+        self.files[filename] = WatchedFile(filename, factory)
+
+    def poll(self):
+        '''Check each watched file once and return how many rows were applied'''
+        changes = 0
+        for watched_file in self.files.values():
+            if watched_file.is_changed() is True:
+                changes += watched_file.apply_changes()
+                logging.info("%s: %i rows changed." % (watched_file.filename, changes))
+        return changes
+
+    def run(self):
+        while self._stop.wait(self.interval) is False:
+            try:
+                self.poll()
+            except Exception as err:
+                logging.warning("Error watching fixtures: %s" % str(err))
+
+    def start(self):
+        if self.is_running() is True:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="FixtureWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
@@ -0,0 +1,110 @@
+import datetime
+import io
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Job:
+    '''A piece of work handed to the background worker and the Future that will hold its result'''
+
+    def __init__(self, name: str, future: Future, blocking: bool):
+        self.name = name
+        self.future = future
+        self.blocking = blocking
+        self.started = datetime.datetime.now()
+
+    def __str__(self):
+        if self.future.done() is False:
+            status = "running"
+        elif self.future.exception() is not None:
+            status = "failed: {0}".format(self.future.exception())
+        else:
+            status = "done"
+        return "{0} ({1}) {2}".format(self.name, datetime.datetime.strftime(self.started, "%H:%M:%S"), status)
+
+
+class ThreadOutput:
+    '''Stands in for sys.stdout while one thread's output is being captured. What that thread prints goes
+    into the captured text and what every other thread prints goes straight through to the real stream.'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.thread = threading.current_thread()
+        self.captured = io.StringIO()
+
+    def write(self, text: str):
+        if threading.current_thread() is self.thread:
+            return self.captured.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return self.captured.getvalue()
+
+
+class BackgroundWorker:
+    '''Runs slow commands such as loading the fixtures or rendering charts on a background thread, one at
+    a time, so that the prompt stays free. Blocking jobs change the data the other commands read, so
+    those commands can wait for them to finish. With background switched off every job runs straight
+    away on the calling thread, which is what a batch script wants.'''
+
+    MAX_JOBS = 20
+
+    def __init__(self, background: bool = True):
+        self.background = background
+        self.jobs = []
+        self._executor = ThreadPoolExecutor(max_workers=1) if background is True else None
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, function, blocking: bool = False):
+
+        if self.background is False:
+            future = Future()
+            try:
+                future.set_result(function())
+            except Exception as err:
+                future.set_exception(err)
+                print("{0} failed: {1}".format(name, err))
+            job = Job(name, future, blocking)
+        else:
+            job = Job(name, self._executor.submit(function), blocking)
+            job.future.add_done_callback(lambda future: self._done(job))
+
+        # Keep the running jobs and the last few that finished
+        with self._lock:
+            self.jobs.append(job)
+            finished = [old_job for old_job in self.jobs if old_job.future.done() is True]
+            for old_job in finished[:max(0, len(finished) - BackgroundWorker.MAX_JOBS)]:
+                self.jobs.remove(old_job)
+        return job
+
+    @staticmethod
+    def _done(job: Job):
+        if job.future.exception() is not None:
+            print("\n{0} failed: {1}".format(job.name, job.future.exception()))
+
+    def running(self, blocking_only: bool = False):
+        with self._lock:
+            return [job for job in self.jobs if job.future.done() is False and
+                    (blocking_only is False or job.blocking is True)]
+
+    def wait(self, blocking_only: bool = False):
+        '''Wait for the running jobs to finish'''
+        for job in self.running(blocking_only):
+            try:
+                job.future.result()
+            except Exception:
+                pass
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def print(self):
+        print("\nBackground Jobs")
+        with self._lock:
+            for job in self.jobs:
+                print("\t{0}".format(job))
+        print("\n")